@@ -1,15 +1,27 @@
 import os
+import sys
 import uuid
+import bisect
 import sqlite3
+import csv
 import json
+import hashlib
+import threading
+import itertools
+import time
 from datetime import datetime, timedelta
-from io import BytesIO
+from io import StringIO
 
+import numpy as np
+import orjson
 import pandas as pd
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 from flask import (
     Flask, request, render_template, redirect, url_for,
-    session, send_file, jsonify, flash, g
+    session, flash, g
 )
+from flask.json.provider import DefaultJSONProvider
 from flask_login import (
     LoginManager, UserMixin,
     login_user, login_required, logout_user, current_user
@@ -19,18 +31,64 @@ from werkzeug.security import generate_password_hash, check_password_hash
 # ----------------------
 # Flask application setup
 # ----------------------
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON through orjson: request.get_json() and the templates' tojson,
+    which embeds the full appointment lists in the schedule pages.
+    Formatting options (sort_keys, indent) are ignored.
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.urandom(24)
 
-# Database file path
-DATABASE = os.path.join(app.root_path, 'schedules.db')
+# Database file path; SCHEDULES_DB points elsewhere (e.g. a scratch file for tests)
+DATABASE = os.environ.get('SCHEDULES_DB', os.path.join(app.root_path, 'schedules.db'))
 
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
-# In-memory store for immediate session data, keyed by user_id
+class SessionCache(TTLCache):
+    """
+    TTLCache for per-user session state. Reading an entry restarts its TTL,
+    so only idle users expire, and all access is serialized because the
+    cache reorders its links even on reads and request threads share it.
+    """
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = super().__getitem__(key)
+            super().__setitem__(key, value)
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            super().__delitem__(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return super().__contains__(key)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return super().get(key, default)
+
+# In-memory store for immediate session data, keyed by user_id; users idle
+# for half an hour are evicted and reload their definitions from the DB
 # Format:
 # data_store[user_id] = {
 #     'appointments': [...],          # for specific-date definitions
@@ -40,7 +98,23 @@ login_manager.init_app(app)
 #     'appointments': [...],          # for recurring definitions
 #     'patterns': [...]               # list of {'label': 'First Monday', 'frequency':..., 'day':...}
 # }
-data_store: dict = {}
+data_store = SessionCache(maxsize=512, ttl=1800)
+
+# Definitions and schedules loaded from the DB, keyed by (kind, user_id,
+# data version); a write bumps the version, so old entries are simply
+# never hit again
+data_cache = TTLCache(maxsize=512, ttl=300)
+data_cache_lock = threading.Lock()
+
+# Password hashes use hashlib.scrypt through werkzeug; hashes made with
+# another method are upgraded on the next successful login
+PASSWORD_HASH_METHOD = 'scrypt'
+
+# Users loaded by Flask-Login on every request, keyed by user_id. Entries
+# expire after a minute; evict with user_cache.pop(hashkey(user_id)) whenever
+# a users row changes.
+user_cache = TTLCache(maxsize=1024, ttl=60)
+user_cache_lock = threading.Lock()
 
 # Fixed truck names and slot definitions
 FIXED_TRUCKS = [
@@ -51,31 +125,208 @@ SLOT_DEFINITIONS = [
     {"label": "A", "start_hour": 7.0, "end_hour": 11.0},
     {"label": "B", "start_hour": 11.0, "end_hour": 14.0}
 ]
+# "<truck>_<slot>" keys of schedule assignments, split ahead of time
+SLOT_KEY_SPLIT = {
+    f"{truck}_{slot['label']}": (truck, slot['label'])
+    for truck in FIXED_TRUCKS for slot in SLOT_DEFINITIONS
+}
+
+def split_slot_key(slot_key):
+    """(truck name, slot label) of an assignment key; keys outside the fixed
+    trucks and slots are split on their last underscore."""
+    parts = SLOT_KEY_SPLIT.get(slot_key)
+    if parts is None:
+        truck_name, sep, slot_label = slot_key.rpartition('_')
+        parts = (truck_name, slot_label) if sep else (slot_key, "")
+    return parts
+
+# Recurrence days and ordinals in display order, with their sort ranks
+WEEKDAYS = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
+ORDINALS = ['First','Second','Third','Fourth','Fifth']
+WEEKDAY_RANK = {d: i for i, d in enumerate(WEEKDAYS)}
+ORDINAL_RANK = {o: i for i, o in enumerate(ORDINALS)}
+
+def intern_recurrence(appointments):
+    """Intern the day and frequency of each appointment in place. There are
+    only a dozen distinct values, so every appointment then shares the same
+    string objects instead of holding copies read from a row or a form.
+    Missing values (possible in migrated legacy rows) are left alone."""
+    for a in appointments:
+        for field in ('day', 'frequency'):
+            if isinstance(a[field], str):
+                a[field] = sys.intern(a[field])
+
+def build_patterns(appointments):
+    """Distinct frequency/day patterns of recurring appointments, in calendar order."""
+    pairs = {(a['frequency'], a['day']) for a in appointments}
+    return [
+        {'label': sys.intern(f"{frequency} {day}"), 'frequency': frequency, 'day': day}
+        for frequency, day in sorted(pairs, key=lambda p: (ORDINAL_RANK[p[0]], WEEKDAY_RANK[p[1]]))
+    ]
+
+# Appointment fields as persisted, in column order
+SPECIFIC_APPOINTMENT_COLUMNS = (
+    'id', 'agency_number', 'account_name', 'area', 'min_weight', 'max_weight',
+    'start_time', 'end_time', 'start_hour'
+)
+RECURRING_APPOINTMENT_COLUMNS = (
+    'id', 'agency_number', 'account_name', 'area', 'min_weight', 'max_weight',
+    'day', 'frequency', 'start_hour', 'end_hour', 'start_time_str', 'end_time_str'
+)
+INSERT_SPECIFIC_APPOINTMENT_SQL = '''
+    INSERT INTO specific_appointments(
+        user_id, id, agency_number, account_name, area, min_weight, max_weight,
+        start_time, end_time, start_hour
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_RECURRING_APPOINTMENT_SQL = '''
+    INSERT INTO recurring_appointments(
+        user_id, id, agency_number, account_name, area, min_weight, max_weight,
+        day, frequency, start_hour, end_hour, start_time_str, end_time_str
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def appointment_row(user_id, appt, columns):
+    """Parameters for INSERT_*_APPOINTMENT_SQL from an appointment dict."""
+    return (user_id,) + tuple(appt.get(c) for c in columns)
+INSERT_SPECIFIC_ASSIGNMENT_SQL = '''
+    INSERT OR IGNORE INTO specific_assignments(user_id, date, slot, appt_id)
+    VALUES (?, ?, ?, ?)
+'''
+INSERT_RECURRING_ASSIGNMENT_SQL = '''
+    INSERT OR IGNORE INTO recurring_assignments(user_id, pattern, slot, appt_id)
+    VALUES (?, ?, ?, ?)
+'''
+
+def assignment_ids_valid(assignments):
+    """True if every appointment id in {date or pattern: {slot_key: [appt ids]}}
+    is a string; the save routes reject anything else."""
+    return all(
+        isinstance(aid, str)
+        for slots in assignments.values() if isinstance(slots, dict)
+        for appt_ids in slots.values() if isinstance(appt_ids, list)
+        for aid in appt_ids
+    )
+
+def assignment_rows(user_id, assignments):
+    """Flatten {date or pattern: {slot_key: [appt ids]}} into INSERT_*_ASSIGNMENT_SQL parameters.
+    Ids that are not strings (only found in legacy blobs) are skipped."""
+    rows = []
+    for key, slots in assignments.items():
+        if not isinstance(slots, dict):
+            continue
+        for slot_key, appt_ids in slots.items():
+            if not isinstance(appt_ids, list):
+                continue
+            rows.extend((user_id, key, slot_key, aid) for aid in appt_ids if isinstance(aid, str))
+    return rows
+
+def assignments_from_rows(rows):
+    """Inverse of assignment_rows for (key, slot, appt_id) rows in insertion order."""
+    assignments = {}
+    for key, slot_key, aid in rows:
+        assignments.setdefault(key, {}).setdefault(slot_key, []).append(aid)
+    return assignments
+
+# JSON decoding for the legacy blob columns, and orjson-encoded responses
+def loads_json(data):
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # Rows written by the stdlib encoder may contain NaN, which orjson rejects
+        return json.loads(data)
+
+@cached({})
+def page_build_tag(template_name):
+    """
+    Short hash of a template's source and of this module, so ETags of the
+    page change when a deploy changes its markup, its scripts or the data
+    the routes pass to it. Computed once per process.
+    """
+    source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, template_name)
+    digest = hashlib.blake2b(source.encode('utf-8'), digest_size=8)
+    with open(__file__, 'rb') as module_file:
+        digest.update(module_file.read())
+    return digest.hexdigest()
+
+def json_response(payload, status=200):
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
+# CSV downloads are streamed in chunks of about this many characters
+CSV_CHUNK_SIZE = 64 * 1024
+
+def csv_response(columns, rows, filename):
+    """
+    Stream rows (sequences in the order of columns) as a CSV attachment,
+    without building the whole file in memory. NaN cells are written empty.
+    """
+    def generate():
+        buf = StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(['' if v != v else v for v in row])
+            if buf.tell() >= CSV_CHUNK_SIZE:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    return app.response_class(
+        generate(), mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 # ----------------------
 # SQLite helpers
 # ----------------------
+# Each worker thread keeps one connection across requests, so its page
+# cache and pragmas survive instead of being rebuilt per request
+db_local = threading.local()
+
+def connect_db():
+    db = sqlite3.connect(DATABASE)
+    db.row_factory = sqlite3.Row
+    # WAL (set once in init_db) makes NORMAL sync safe: commits append to
+    # the log without an fsync each, readers don't block the writer.
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute('PRAGMA temp_store = MEMORY')
+    db.execute('PRAGMA cache_size = -20000')
+    db.execute('PRAGMA mmap_size = 268435456')
+    # Checkpointing (the fsync under WAL + NORMAL) is left to checkpoint_loop
+    db.execute('PRAGMA wal_autocheckpoint = 0')
+    # If you need foreign keys: 
+    # db.execute('PRAGMA foreign_keys = ON')
+    return db
+
 def get_db():
-    db = getattr(g, '_database', None)
+    # Called by every DB helper, often several times per request: the
+    # connection normally exists, so try the attribute before looking further
+    try:
+        return g._database
+    except AttributeError:
+        pass
+    db = getattr(db_local, 'connection', None)
     if db is None:
-        db = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
-        # If you need foreign keys: 
-        # db.execute('PRAGMA foreign_keys = ON')
-        g._database = db
+        db = db_local.connection = connect_db()
+    g._database = db
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
     db = getattr(g, '_database', None)
     if db is not None:
-        db.close()
+        # The connection is reused by this thread's next request: never let
+        # an unfinished transaction (e.g. after an error) carry over
+        if db.in_transaction:
+            db.rollback()
 
 def init_db():
-    """Initialize tables: users, specific_definitions, recurring_definitions,
+    """Initialize tables: users, specific_appointments, recurring_appointments,
        specific_schedules, recurring_schedules."""
     db = sqlite3.connect(DATABASE)
     cursor = db.cursor()
+    # journal_mode is persistent in the database file
+    cursor.execute('PRAGMA journal_mode = WAL')
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -84,7 +335,80 @@ def init_db():
             password_hash TEXT NOT NULL
         )
     ''')
-    # Definitions tables
+    # Definitions tables, one row per appointment
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS specific_appointments (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            agency_number TEXT,
+            account_name TEXT,
+            area TEXT,
+            min_weight REAL,
+            max_weight REAL,
+            start_time TEXT,
+            end_time TEXT,
+            start_hour REAL,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_spec_user ON specific_appointments(user_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_appointments (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            agency_number TEXT,
+            account_name TEXT,
+            area TEXT,
+            min_weight REAL,
+            max_weight REAL,
+            day TEXT,
+            frequency TEXT,
+            start_hour REAL,
+            end_hour REAL,
+            start_time_str TEXT,
+            end_time_str TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    # Covers the distinct frequency/day pairs read by select_recurring_patterns
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rec_pattern ON recurring_appointments(user_id, frequency, day)')
+    # Version counter per user and kind of data (see bump_data_version)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY(user_id, kind)
+        )
+    ''')
+    # Schedule assignments, one row per appointment placed in a slot. The
+    # key is a date (specific) or a pattern label (recurring); rows are
+    # inserted in payload order and read back by rowid, which keeps the order
+    # of appointments inside a slot.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS specific_assignments (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            appt_id TEXT NOT NULL,
+            PRIMARY KEY(user_id, date, slot, appt_id),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_spec_assign_appt ON specific_assignments(user_id, appt_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_assignments (
+            user_id INTEGER NOT NULL,
+            pattern TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            appt_id TEXT NOT NULL,
+            PRIMARY KEY(user_id, pattern, slot, appt_id),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rec_assign_appt ON recurring_assignments(user_id, appt_id)')
+    # Legacy definitions tables (one JSON blob per user), migrated into the
+    # tables above by migrate_json_definitions
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS specific_definitions (
             user_id INTEGER PRIMARY KEY,
@@ -99,7 +423,7 @@ def init_db():
             FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
         )
     ''')
-    # Schedules tables
+    # Legacy schedules tables, migrated by migrate_json_schedules
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS specific_schedules (
             user_id INTEGER PRIMARY KEY,
@@ -115,79 +439,418 @@ def init_db():
         )
     ''')
     db.commit()
+    migrated = migrate_json_definitions(db) + migrate_json_schedules(db)
+    if migrated:
+        # The JSON blobs were the bulk of the file; give their pages back
+        db.execute('VACUUM')
     db.close()
 
+def legacy_agency_number(value):
+    """
+    An agency number from a legacy blob in the form uploads now keep. Those
+    uploads let pandas infer the column, which turned 123 into '123.0' when
+    the column had a blank; leading zeros ('00123' read as '123') were lost
+    then and cannot be restored.
+    """
+    if isinstance(value, str) and value.endswith('.0') and value[:-2].isdigit():
+        return value[:-2]
+    return value
+
+def migrate_json_definitions(db):
+    """Move definitions stored as a single JSON blob per user into rows.
+    Returns the number of blobs migrated."""
+    legacy = (
+        ('specific_definitions', SPECIFIC_APPOINTMENT_COLUMNS,
+         INSERT_SPECIFIC_APPOINTMENT_SQL),
+        ('recurring_definitions', RECURRING_APPOINTMENT_COLUMNS,
+         INSERT_RECURRING_APPOINTMENT_SQL),
+    )
+    migrated = 0
+    for table, columns, insert_sql in legacy:
+        rows = db.execute(f'SELECT user_id, data FROM {table}').fetchall()
+        for user_id, data in rows:
+            try:
+                appts = loads_json(data) if data else []
+            except ValueError:
+                continue
+            # Guard the id primary key against duplicated entries in a blob
+            appts = {a.get('id'): a for a in appts}.values()
+            for a in appts:
+                a['agency_number'] = legacy_agency_number(a.get('agency_number'))
+            with db:
+                db.executemany(insert_sql, [appointment_row(user_id, a, columns) for a in appts])
+                db.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+            migrated += 1
+    return migrated
+
+def migrate_json_schedules(db):
+    """Move schedules stored as a single JSON blob per user into assignment rows.
+    Returns the number of blobs migrated."""
+    legacy = (
+        ('specific_schedules', INSERT_SPECIFIC_ASSIGNMENT_SQL),
+        ('recurring_schedules', INSERT_RECURRING_ASSIGNMENT_SQL),
+    )
+    migrated = 0
+    for table, insert_sql in legacy:
+        rows = db.execute(f'SELECT user_id, data FROM {table}').fetchall()
+        for user_id, data in rows:
+            try:
+                assignments = loads_json(data) if data else {}
+            except ValueError:
+                continue
+            if not isinstance(assignments, dict):
+                assignments = {}
+            with db:
+                db.executemany(insert_sql, assignment_rows(user_id, assignments))
+                db.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+            migrated += 1
+    return migrated
+
 with app.app_context():
     init_db()
 
-# Helpers for persisted definitions and schedules
-def save_specific_definitions_to_db(user_id, data_json_str):
+# Seconds between WAL checkpoints, and between planner statistics refreshes
+CHECKPOINT_INTERVAL = 30
+OPTIMIZE_INTERVAL = 3600
+
+def checkpoint_loop():
+    """
+    Copy committed WAL pages back into the database file every
+    CHECKPOINT_INTERVAL seconds. Request connections disable automatic
+    checkpoints, so the commit that crosses the WAL size threshold no longer
+    pays for the checkpoint's fsync while its client waits; writes stay
+    synchronous, so a save is visible to the very next request.
+
+    Every OPTIMIZE_INTERVAL seconds it also lets SQLite refresh planner
+    statistics that have gone stale. That can take the write lock, so it
+    runs here rather than at the end of a request.
+    """
+    db = sqlite3.connect(DATABASE)
+    next_optimize = time.monotonic() + OPTIMIZE_INTERVAL
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        try:
+            db.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        except sqlite3.Error:
+            app.logger.exception("WAL checkpoint failed")
+        if time.monotonic() >= next_optimize:
+            next_optimize += OPTIMIZE_INTERVAL
+            try:
+                # 0x10002 checks every table: this connection runs no
+                # queries that would mark them as used
+                db.execute('PRAGMA optimize=0x10002')
+            except sqlite3.Error:
+                app.logger.exception("PRAGMA optimize failed")
+
+threading.Thread(target=checkpoint_loop, name='wal-checkpoint', daemon=True).start()
+
+# Per-user data versions, bumped in the same transaction as every write so
+# derived data can be cached across requests and worker processes
+def bump_data_version(db, user_id, kind):
+    """Increment the (user_id, kind) version and return the new value."""
+    return db.execute('''
+        INSERT INTO data_versions(user_id, kind, version)
+        VALUES (?, ?, 1)
+        ON CONFLICT(user_id, kind) DO UPDATE SET version = version + 1
+        RETURNING version
+    ''', (user_id, kind)).fetchone()[0]
+
+def load_data_version(user_id, kind):
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('''
-        INSERT INTO specific_definitions(user_id, data)
-        VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET data=excluded.data
-    ''', (user_id, data_json_str))
-    db.commit()
+    cursor.execute('SELECT version FROM data_versions WHERE user_id = ? AND kind = ?', (user_id, kind))
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+def load_versioned(user_id, kind, select, name=None):
+    """Return select(user_id), cached until the (user_id, kind) version changes.
+    Callers share the cached object, so a stale copy is never handed out but a
+    mutated one is: only mutate it alongside a write that bumps the version.
+    name tells apart several values derived from the same kind of data."""
+    key = (name or kind, user_id, load_data_version(user_id, kind))
+    with data_cache_lock:
+        value = data_cache.get(key)
+    if value is None:
+        value = select(user_id)
+        with data_cache_lock:
+            data_cache[key] = value
+    return value
+
+def peek_versioned(user_id, kind, name=None):
+    """The cached value load_versioned would return, or None without
+    selecting anything."""
+    key = (name or kind, user_id, load_data_version(user_id, kind))
+    with data_cache_lock:
+        return data_cache.get(key)
+
+def remember_versioned(user_id, kind, version, value):
+    """Seed the cache with data just written at version, so the next
+    load_versioned hands out the caller's object instead of re-reading it."""
+    with data_cache_lock:
+        data_cache[(kind, user_id, version)] = value
+
+# Helpers for persisted definitions and schedules
+def save_specific_definitions_to_db(user_id, appointments):
+    """Replace all specific-date definitions of a user (CSV upload)."""
+    db = get_db()
+    with db:
+        db.execute('DELETE FROM specific_appointments WHERE user_id = ?', (user_id,))
+        db.executemany(
+            INSERT_SPECIFIC_APPOINTMENT_SQL,
+            [appointment_row(user_id, a, SPECIFIC_APPOINTMENT_COLUMNS) for a in appointments]
+        )
+        version = bump_data_version(db, user_id, 'specific_definitions')
+    remember_versioned(user_id, 'specific_definitions', version, appointments)
 
 def load_specific_definitions_from_db(user_id):
+    """Definitions of a user in upload order; memoized until they change."""
+    return load_versioned(user_id, 'specific_definitions', select_specific_definitions)
+
+def load_specific_definitions_by_id(user_id):
+    """Definitions of a user indexed by id; memoized with the definitions."""
+    return load_versioned(
+        user_id, 'specific_definitions',
+        lambda uid: {appt['id']: appt for appt in load_specific_definitions_from_db(uid)},
+        name='specific_definitions_by_id'
+    )
+
+def select_specific_definitions(user_id):
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('SELECT data FROM specific_definitions WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    return row['data'] if row else None
+    cursor.execute('''
+        SELECT id, agency_number, account_name, area, min_weight, max_weight,
+               start_time, end_time, start_hour
+        FROM specific_appointments WHERE user_id = ? ORDER BY rowid
+    ''', (user_id,))
+    return [dict(row) for row in cursor.fetchall()]
 
-def save_recurring_definitions_to_db(user_id, data_json_str):
+def add_specific_definition_to_db(user_id, appt):
+    db = get_db()
+    with db:
+        db.execute(INSERT_SPECIFIC_APPOINTMENT_SQL,
+                   appointment_row(user_id, appt, SPECIFIC_APPOINTMENT_COLUMNS))
+        bump_data_version(db, user_id, 'specific_definitions')
+
+def add_specific_definitions_to_db(user_id, appts):
+    """Insert several definitions in one transaction."""
+    db = get_db()
+    with db:
+        db.executemany(
+            INSERT_SPECIFIC_APPOINTMENT_SQL,
+            [appointment_row(user_id, a, SPECIFIC_APPOINTMENT_COLUMNS) for a in appts]
+        )
+        bump_data_version(db, user_id, 'specific_definitions')
+
+def update_specific_definition_in_db(user_id, appt):
+    """Update one definition in place; returns False if the id is unknown."""
     db = get_db()
     cursor = db.cursor()
     cursor.execute('''
-        INSERT INTO recurring_definitions(user_id, data)
-        VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET data=excluded.data
-    ''', (user_id, data_json_str))
+        UPDATE specific_appointments
+        SET agency_number = ?, account_name = ?, area = ?, min_weight = ?, max_weight = ?,
+            start_time = ?, end_time = ?, start_hour = ?
+        WHERE id = ? AND user_id = ?
+    ''', (appt['agency_number'], appt['account_name'], appt['area'],
+          appt['min_weight'], appt['max_weight'],
+          appt['start_time'], appt['end_time'], appt['start_hour'],
+          appt['id'], user_id))
+    found = cursor.rowcount > 0
+    if found:
+        bump_data_version(db, user_id, 'specific_definitions')
     db.commit()
+    return found
+
+def delete_specific_definition_from_db(user_id, appt_id):
+    """Delete one definition and its schedule assignments in one transaction;
+    returns False if the id is unknown."""
+    db = get_db()
+    with db:
+        cursor = db.execute('DELETE FROM specific_appointments WHERE id = ? AND user_id = ?',
+                            (appt_id, user_id))
+        found = cursor.rowcount > 0
+        # Nothing was deleted for an unknown id: leave the schedule and
+        # the cached definitions alone
+        if found:
+            db.execute('DELETE FROM specific_assignments WHERE user_id = ? AND appt_id = ?',
+                       (user_id, appt_id))
+            bump_data_version(db, user_id, 'specific_definitions')
+            bump_data_version(db, user_id, 'specific_schedule')
+    return found
+
+def save_recurring_definitions_to_db(user_id, appointments):
+    """Replace all recurring definitions of a user (CSV upload or merge)."""
+    db = get_db()
+    with db:
+        db.execute('DELETE FROM recurring_appointments WHERE user_id = ?', (user_id,))
+        db.executemany(
+            INSERT_RECURRING_APPOINTMENT_SQL,
+            [appointment_row(user_id, a, RECURRING_APPOINTMENT_COLUMNS) for a in appointments]
+        )
+        version = bump_data_version(db, user_id, 'recurring_definitions')
+    remember_versioned(user_id, 'recurring_definitions', version, appointments)
 
 def load_recurring_definitions_from_db(user_id):
+    """Definitions of a user in upload order; memoized until they change."""
+    return load_versioned(user_id, 'recurring_definitions', select_recurring_definitions)
+
+def load_recurring_definitions_by_id(user_id):
+    """Definitions of a user indexed by id; memoized with the definitions."""
+    return load_versioned(
+        user_id, 'recurring_definitions',
+        lambda uid: {appt['id']: appt for appt in load_recurring_definitions_from_db(uid)},
+        name='recurring_definitions_by_id'
+    )
+
+def load_recurring_definitions_subset(user_id, appt_ids):
+    """Definitions with the given ids, indexed by id. Served from the memoized
+    definitions when they are cached, else only those rows are read."""
+    if peek_versioned(user_id, 'recurring_definitions', 'recurring_definitions_by_id') is not None \
+            or peek_versioned(user_id, 'recurring_definitions') is not None:
+        return load_recurring_definitions_by_id(user_id)
+    db = get_db()
+    cursor = db.execute('''
+        SELECT id, agency_number, account_name, area, min_weight, max_weight,
+               day, frequency, start_hour, end_hour, start_time_str, end_time_str
+        FROM recurring_appointments
+        WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+    ''', (user_id, orjson.dumps(list(appt_ids)).decode()))
+    return {row['id']: dict(row) for row in cursor}
+
+def load_recurring_patterns(user_id):
+    """Patterns of a user's recurring definitions; memoized with the definitions.
+    The list is shared: copy it before storing it somewhere it is edited."""
+    return load_versioned(
+        user_id, 'recurring_definitions',
+        select_recurring_patterns,
+        name='recurring_patterns'
+    )
+
+def load_recurring_patterns_by_label(user_id):
+    """Patterns of a user indexed by label; memoized with the definitions."""
+    return load_versioned(
+        user_id, 'recurring_definitions',
+        lambda uid: {p['label']: p for p in load_recurring_patterns(uid)},
+        name='recurring_patterns_by_label'
+    )
+
+def select_recurring_patterns(user_id):
+    """Patterns straight from the frequency/day index, without loading the
+    definitions themselves."""
+    db = get_db()
+    rows = db.execute(
+        'SELECT DISTINCT frequency, day FROM recurring_appointments WHERE user_id = ?',
+        (user_id,)
+    ).fetchall()
+    return build_patterns(rows)
+
+def select_recurring_definitions(user_id):
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('SELECT data FROM recurring_definitions WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    return row['data'] if row else None
+    cursor.execute('''
+        SELECT id, agency_number, account_name, area, min_weight, max_weight,
+               day, frequency, start_hour, end_hour, start_time_str, end_time_str
+        FROM recurring_appointments WHERE user_id = ? ORDER BY rowid
+    ''', (user_id,))
+    appointments = [dict(row) for row in cursor.fetchall()]
+    intern_recurrence(appointments)
+    return appointments
+
+def add_recurring_definition_to_db(user_id, appt):
+    db = get_db()
+    with db:
+        db.execute(INSERT_RECURRING_APPOINTMENT_SQL,
+                   appointment_row(user_id, appt, RECURRING_APPOINTMENT_COLUMNS))
+        bump_data_version(db, user_id, 'recurring_definitions')
 
-def save_specific_schedule_to_db(user_id, data_json_str):
+def update_recurring_definition_in_db(user_id, appt):
+    """Update one definition in place; returns False if the id is unknown."""
     db = get_db()
     cursor = db.cursor()
     cursor.execute('''
-        INSERT INTO specific_schedules(user_id, data)
-        VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET data=excluded.data
-    ''', (user_id, data_json_str))
+        UPDATE recurring_appointments
+        SET agency_number = ?, account_name = ?, area = ?, min_weight = ?, max_weight = ?,
+            day = ?, frequency = ?, start_hour = ?, end_hour = ?,
+            start_time_str = ?, end_time_str = ?
+        WHERE id = ? AND user_id = ?
+    ''', (appt['agency_number'], appt['account_name'], appt['area'],
+          appt['min_weight'], appt['max_weight'], appt['day'], appt['frequency'],
+          appt['start_hour'], appt['end_hour'],
+          appt['start_time_str'], appt['end_time_str'],
+          appt['id'], user_id))
+    found = cursor.rowcount > 0
+    if found:
+        bump_data_version(db, user_id, 'recurring_definitions')
     db.commit()
+    return found
 
-def load_specific_schedule_from_db(user_id):
+def delete_recurring_definition_from_db(user_id, appt_id):
+    """Delete one definition and its schedule assignments in one transaction;
+    returns False if the id is unknown."""
     db = get_db()
-    cursor = db.cursor()
-    cursor.execute('SELECT data FROM specific_schedules WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    return row['data'] if row else None
+    with db:
+        cursor = db.execute('DELETE FROM recurring_appointments WHERE id = ? AND user_id = ?',
+                            (appt_id, user_id))
+        found = cursor.rowcount > 0
+        # Nothing was deleted for an unknown id: leave the schedule and
+        # the cached definitions alone
+        if found:
+            db.execute('DELETE FROM recurring_assignments WHERE user_id = ? AND appt_id = ?',
+                       (user_id, appt_id))
+            bump_data_version(db, user_id, 'recurring_definitions')
+            bump_data_version(db, user_id, 'recurring_schedule')
+    return found
+
+def save_specific_schedule_to_db(user_id, assignments):
+    """Replace the saved specific-date assignments of a user."""
+    db = get_db()
+    with db:
+        db.execute('DELETE FROM specific_assignments WHERE user_id = ?', (user_id,))
+        db.executemany(INSERT_SPECIFIC_ASSIGNMENT_SQL, assignment_rows(user_id, assignments))
+        bump_data_version(db, user_id, 'specific_schedule')
+
+def load_specific_schedule_from_db(user_id):
+    """Saved assignments of a user; memoized until they change."""
+    return load_versioned(user_id, 'specific_schedule', select_specific_schedule)
 
-def save_recurring_schedule_to_db(user_id, data_json_str):
+def select_specific_schedule(user_id):
     db = get_db()
     cursor = db.cursor()
     cursor.execute('''
-        INSERT INTO recurring_schedules(user_id, data)
-        VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET data=excluded.data
-    ''', (user_id, data_json_str))
-    db.commit()
+        SELECT date, slot, appt_id FROM specific_assignments
+        WHERE user_id = ? ORDER BY rowid
+    ''', (user_id,))
+    return assignments_from_rows(cursor.fetchall())
+
+def save_recurring_schedule_to_db(user_id, assignments):
+    """Replace the saved recurring assignments of a user."""
+    db = get_db()
+    with db:
+        db.execute('DELETE FROM recurring_assignments WHERE user_id = ?', (user_id,))
+        db.executemany(INSERT_RECURRING_ASSIGNMENT_SQL, assignment_rows(user_id, assignments))
+        bump_data_version(db, user_id, 'recurring_schedule')
 
 def load_recurring_schedule_from_db(user_id):
+    """Saved assignments of a user; memoized until they change."""
+    return load_versioned(user_id, 'recurring_schedule', select_recurring_schedule)
+
+def select_recurring_schedule(user_id):
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('SELECT data FROM recurring_schedules WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    return row['data'] if row else None
+    cursor.execute('''
+        SELECT pattern, slot, appt_id FROM recurring_assignments
+        WHERE user_id = ? ORDER BY rowid
+    ''', (user_id,))
+    return assignments_from_rows(cursor.fetchall())
+
+def remove_recurring_assignments_from_db(user_id, appt_ids):
+    """Drop the given appointment ids from every saved recurring slot."""
+    db = get_db()
+    with db:
+        cursor = db.executemany('DELETE FROM recurring_assignments WHERE user_id = ? AND appt_id = ?',
+                                [(user_id, aid) for aid in appt_ids])
+        # None of the ids were assigned: keep the cached schedule
+        if cursor.rowcount > 0:
+            bump_data_version(db, user_id, 'recurring_schedule')
 
 # ----------------------
 # Flask-Login user model
@@ -199,10 +862,11 @@ class User(UserMixin):
         self.password_hash = password_hash
 
     @staticmethod
+    @cached(user_cache, lock=user_cache_lock)
     def get(user_id):
         db = get_db()
         cursor = db.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        cursor.execute('SELECT id, username, password_hash FROM users WHERE id = ?', (user_id,))
         row = cursor.fetchone()
         if row:
             return User(row['id'], row['username'], row['password_hash'])
@@ -212,7 +876,7 @@ class User(UserMixin):
     def find_by_username(username):
         db = get_db()
         cursor = db.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
+        cursor.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,))
         row = cursor.fetchone()
         if row:
             return User(row['id'], row['username'], row['password_hash'])
@@ -222,24 +886,164 @@ class User(UserMixin):
     def create(username, password):
         db = get_db()
         cursor = db.cursor()
-        password_hash = generate_password_hash(password)
+        password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
         try:
-            cursor.execute('INSERT INTO users(username, password_hash) VALUES (?, ?)', (username, password_hash))
+            cursor.execute('INSERT INTO users(username, password_hash) VALUES (?, ?) RETURNING id',
+                           (username, password_hash))
+            # RETURNING rows must be read before the statement (and so the
+            # transaction) can finish
+            user_id = cursor.fetchone()['id']
             db.commit()
-            user_id = cursor.lastrowid
+            with user_cache_lock:
+                user_cache.pop(hashkey(user_id), None)
             return User(user_id, username, password_hash)
         except sqlite3.IntegrityError:
             raise ValueError("Username already exists")
 
+    def needs_rehash(self):
+        """True for hashes made with another method (e.g. werkzeug's older pbkdf2 default)."""
+        return not self.password_hash.startswith(PASSWORD_HASH_METHOD + ':')
+
+    def set_password(self, password):
+        db = get_db()
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+        db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (self.password_hash, self.id))
+        db.commit()
+        with user_cache_lock:
+            user_cache.pop(hashkey(self.id), None)
+
 @login_manager.user_loader
 def load_user(user_id):
     try:
         return User.get(int(user_id))
-    except:
+    except (TypeError, ValueError):
         return None
 # ----------------------
 # Add appointment routes
 # ----------------------
+def new_ids(count):
+    """
+    count random 128-bit hex IDs, like uuid4().hex, from a single
+    os.urandom call; for bulk imports.
+    """
+    hex_ids = os.urandom(16 * count).hex()
+    return [hex_ids[i:i + 32] for i in range(0, 32 * count, 32)]
+
+def validate_common_fields(agency_number, account_name, area,
+                           min_w_raw, max_w_raw, errors):
+    """
+    Check the fields shared by specific and recurring appointments,
+    appending messages to errors. Returns (min_weight, max_weight).
+    """
+    if not agency_number:
+        errors.append("Agency Number is required.")
+    if not account_name:
+        errors.append("Account Name is required.")
+    if not area:
+        errors.append("Area is required.")
+    # Validate numeric weights (allow blank or zero if desired)
+    min_w = max_w = None
+    try:
+        min_w = float(min_w_raw) if min_w_raw else 0.0
+    except ValueError:
+        errors.append("Minimum Weight must be a number.")
+    try:
+        max_w = float(max_w_raw) if max_w_raw else 0.0
+    except ValueError:
+        errors.append("Maximum Weight must be a number.")
+    return min_w, max_w
+
+def parse_datetime_field(raw, label, errors):
+    """Parse a "YYYY-MM-DDTHH:MM[:SS]" value, or record an error and return None."""
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        errors.append(f"{label} is required and must be in correct format.")
+        return None
+
+def parse_hour_field(raw, label, errors):
+    """Parse an "HH:MM" value into fractional hours, or record an error and return None."""
+    try:
+        t = datetime.strptime(raw, '%H:%M')
+    except ValueError:
+        errors.append(f"{label} is required and must be HH:MM.")
+        return None
+    return t.hour + t.minute/60.0
+
+def build_specific_appointment(agency_number, account_name, area,
+                               min_w_raw, max_w_raw, start_dt_raw, end_dt_raw,
+                               appt_id=None):
+    """
+    Validate stripped form/JSON values of a specific-date appointment.
+    Returns (appointment dict, []) or (None, list of error messages).
+    A new ID is generated unless appt_id is given.
+    """
+    errors = []
+    min_w, max_w = validate_common_fields(
+        agency_number, account_name, area, min_w_raw, max_w_raw, errors
+    )
+    start_dt = parse_datetime_field(start_dt_raw, "Start Time", errors)
+    end_dt = parse_datetime_field(end_dt_raw, "End Time", errors)
+    if start_dt and end_dt:
+        if (start_dt.tzinfo is None) != (end_dt.tzinfo is None):
+            errors.append("Start Time and End Time must both have a UTC offset, or neither.")
+        elif end_dt <= start_dt:
+            errors.append("End Time must be after Start Time.")
+    if errors:
+        return None, errors
+
+    new_appt = {
+        'id': appt_id or uuid.uuid4().hex,
+        'agency_number': agency_number,
+        'account_name': account_name,
+        'area': area,
+        'min_weight': min_w,
+        'max_weight': max_w,
+        'start_time': start_dt.isoformat(),
+        'end_time': end_dt.isoformat(),
+        'start_hour': start_dt.hour + start_dt.minute/60.0
+    }
+    return new_appt, []
+
+def build_recurring_appointment(agency_number, account_name, area,
+                                min_w_raw, max_w_raw, day, frequency,
+                                start_time_raw, end_time_raw, appt_id=None):
+    """
+    Validate stripped form/JSON values of a recurring appointment.
+    Returns (appointment dict, []) or (None, list of error messages).
+    A new ID is generated unless appt_id is given.
+    """
+    errors = []
+    min_w, max_w = validate_common_fields(
+        agency_number, account_name, area, min_w_raw, max_w_raw, errors
+    )
+    if day not in WEEKDAY_RANK:
+        errors.append(f"Day must be one of {WEEKDAYS}.")
+    if frequency not in ORDINAL_RANK:
+        errors.append(f"Frequency must be one of {ORDINALS}.")
+    start_hour = parse_hour_field(start_time_raw, "Start Time", errors)
+    end_hour = parse_hour_field(end_time_raw, "End Time", errors)
+    if start_hour is not None and end_hour is not None and end_hour <= start_hour:
+        errors.append("End Time must be after Start Time.")
+    if errors:
+        return None, errors
+
+    new_appt = {
+        'id': appt_id or uuid.uuid4().hex,
+        'agency_number': agency_number,
+        'account_name': account_name,
+        'area': area,
+        'min_weight': min_w,
+        'max_weight': max_w,
+        'day': sys.intern(day),
+        'frequency': sys.intern(frequency),
+        'start_hour': start_hour,
+        'end_hour': end_hour,
+        'start_time_str': start_time_raw,
+        'end_time_str': end_time_raw
+    }
+    return new_appt, []
+
 @app.route('/add_specific_appointment', methods=['POST'])
 @login_required
 def add_specific_appointment():
@@ -270,86 +1074,24 @@ def add_specific_appointment():
         max_w_raw     = request.form.get('max_weight', '').strip()
         start_dt_raw  = request.form.get('start_datetime', '').strip()
         end_dt_raw    = request.form.get('end_datetime', '').strip()
-    # Basic validation
-    errors = []
-    if not agency_number:
-        errors.append("Agency Number is required.")
-    if not account_name:
-        errors.append("Account Name is required.")
-    if not area:
-        errors.append("Area is required.")
-    # Validate numeric weights (allow blank or zero if desired)
-    try:
-        min_w = float(min_w_raw) if min_w_raw else 0.0
-    except:
-        errors.append("Minimum Weight must be a number.")
-    try:
-        max_w = float(max_w_raw) if max_w_raw else 0.0
-    except:
-        errors.append("Maximum Weight must be a number.")
-    # Parse datetime-local: format "YYYY-MM-DDTHH:MM"
-    try:
-        if not start_dt_raw:
-            raise ValueError
-        # datetime.fromisoformat can parse "YYYY-MM-DDTHH:MM"
-        start_dt = datetime.fromisoformat(start_dt_raw)
-    except:
-        errors.append("Start Time is required and must be in correct format.")
-    try:
-        if not end_dt_raw:
-            raise ValueError
-        end_dt = datetime.fromisoformat(end_dt_raw)
-    except:
-        errors.append("End Time is required and must be in correct format.")
-    # If parsed, check end > start
-    if 'start_dt' in locals() and 'end_dt' in locals():
-        if end_dt <= start_dt:
-            errors.append("End Time must be after Start Time.")
-
+    new_appt, errors = build_specific_appointment(
+        agency_number, account_name, area, min_w_raw, max_w_raw, start_dt_raw, end_dt_raw
+    )
     if errors:
         if request.is_json:
-            return jsonify({'error': '; '.join(errors)}), 400
+            return json_response({'error': '; '.join(errors)}, 400)
         for e in errors:
             flash(e, "error")
         # Redirect back to schedule; user will see flashes
         return redirect(url_for('schedule'))
 
-
-    # Build new appointment dict matching your existing structure
-    start_iso = start_dt.isoformat()
-    end_iso   = end_dt.isoformat()
-    start_hour = start_dt.hour + start_dt.minute/60.0
-
-    new_appt = {
-        'id': str(uuid.uuid4()),
-        'agency_number': agency_number,
-        'account_name': account_name,
-        'area': area,
-        'min_weight': min_w,
-        'max_weight': max_w,
-        'start_time': start_iso,
-        'end_time': end_iso,
-        'start_hour': start_hour
-    }
-
-    # Load existing definitions JSON from DB
-    defs_json = load_specific_definitions_from_db(user_id)
-    if defs_json:
-        try:
-            appts = json.loads(defs_json)
-        except:
-            appts = []
-    else:
-        appts = []
-    # Append
-    appts.append(new_appt)
-    # Save back to DB
+    # Insert the single new row
     try:
-        save_specific_definitions_to_db(user_id, json.dumps(appts))
-    except Exception:
+        add_specific_definition_to_db(user_id, new_appt)
+    except sqlite3.Error:
         app.logger.exception("Failed to save new specific appointment")
         if request.is_json:
-            return jsonify({'error': 'Failed to persist new appointment'}), 500
+            return json_response({'error': 'Failed to persist new appointment'}, 500)
         flash("Failed to persist new appointment.", "error")
         # but continue to update in-memory so session sees it
     # Also update in-memory store if present
@@ -357,12 +1099,67 @@ def add_specific_appointment():
         # update the list
         data_store[user_id].setdefault('appointments', []).append(new_appt)
     if request.is_json:
-        return jsonify({'success': True, 'new_appt': new_appt})
+        return json_response({'success': True, 'new_appt': new_appt})
     flash("Added new appointment.", "info")
     # Redirect back to scheduler
     return redirect(url_for('schedule'))
 
 
+@app.route('/add_specific_appointments_bulk', methods=['POST'])
+@login_required
+def add_specific_appointments_bulk():
+    """
+    Add several specific-date appointments with a single commit.
+    Expects JSON:
+    {
+      "appointments": [
+        {"agency_number": "...", "account_name": "...", "area": "...",
+         "min_weight": ..., "max_weight": ...,
+         "start_time": "YYYY-MM-DDTHH:MM", "end_time": "YYYY-MM-DDTHH:MM"},
+        ...
+      ]
+    }
+    Nothing is saved if any entry is invalid.
+    """
+    user_id = current_user.id
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('appointments'), list):
+        return json_response({'error': 'Invalid payload'}, 400)
+    if not data['appointments']:
+        return json_response({'error': 'No appointments to add'}, 400)
+
+    new_appts = []
+    errors = []
+    for n, item in enumerate(data['appointments'], start=1):
+        if not isinstance(item, dict):
+            errors.append(f"Appointment {n}: invalid entry.")
+            continue
+        new_appt, item_errors = build_specific_appointment(
+            str(item.get('agency_number', '')).strip(),
+            str(item.get('account_name', '')).strip(),
+            str(item.get('area', '')).strip(),
+            str(item.get('min_weight', '')).strip(),
+            str(item.get('max_weight', '')).strip(),
+            str(item.get('start_time', '')).strip(),
+            str(item.get('end_time', '')).strip()
+        )
+        errors.extend(f"Appointment {n}: {e}" for e in item_errors)
+        if new_appt:
+            new_appts.append(new_appt)
+    if errors:
+        return json_response({'error': '; '.join(errors)}, 400)
+
+    try:
+        add_specific_definitions_to_db(user_id, new_appts)
+    except sqlite3.Error:
+        app.logger.exception("Failed to save new specific appointments")
+        return json_response({'error': 'Failed to persist new appointments'}, 500)
+    store = data_store.get(user_id)
+    if store and 'appointments' in store:
+        store['appointments'].extend(new_appts)
+    return json_response({'success': True, 'new_appts': new_appts})
+
+
 @app.route('/add_recurring_appointment', methods=['POST'])
 @login_required
 def add_recurring_appointment():
@@ -398,111 +1195,40 @@ def add_recurring_appointment():
         start_time_raw= request.form.get('start_time', '').strip()  # format "HH:MM"
         end_time_raw  = request.form.get('end_time', '').strip()
 
-    # Validate
-    weekdays = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals = ['First','Second','Third','Fourth','Fifth']
-    errors = []
-    if not agency_number:
-        errors.append("Agency Number is required.")
-    if not account_name:
-        errors.append("Account Name is required.")
-    if not area:
-        errors.append("Area is required.")
-    try:
-        min_w = float(min_w_raw) if min_w_raw else 0.0
-    except:
-        errors.append("Minimum Weight must be a number.")
-    try:
-        max_w = float(max_w_raw) if max_w_raw else 0.0
-    except:
-        errors.append("Maximum Weight must be a number.")
-    if day not in weekdays:
-        errors.append(f"Day must be one of {weekdays}.")
-    if frequency not in ordinals:
-        errors.append(f"Frequency must be one of {ordinals}.")
-    # Parse time strings
-    try:
-        if not start_time_raw:
-            raise ValueError
-        # parse "HH:MM" into a datetime.time
-        from datetime import time
-        h,m = map(int, start_time_raw.split(':'))
-        start_hour = h + m/60.0
-    except:
-        errors.append("Start Time is required and must be HH:MM.")
-    try:
-        if not end_time_raw:
-            raise ValueError
-        h2,m2 = map(int, end_time_raw.split(':'))
-        end_hour = h2 + m2/60.0
-    except:
-        errors.append("End Time is required and must be HH:MM.")
-    if 'start_hour' in locals() and 'end_hour' in locals():
-        if end_hour <= start_hour:
-            errors.append("End Time must be after Start Time.")
-
+    new_appt, errors = build_recurring_appointment(
+        agency_number, account_name, area, min_w_raw, max_w_raw,
+        day, frequency, start_time_raw, end_time_raw
+    )
     if errors:
         if request.is_json:
-            return jsonify({'error': '; '.join(errors)}), 400
+            return json_response({'error': '; '.join(errors)}, 400)
         for e in errors:
             flash(e, "error")
         return redirect(url_for('recurring_schedule'))
 
-    # Build new recurring appointment dict matching your structure:
-    new_appt = {
-        'id': str(uuid.uuid4()),
-        'agency_number': agency_number,
-        'account_name': account_name,
-        'area': area,
-        'min_weight': min_w,
-        'max_weight': max_w,
-        'day': day,
-        'frequency': frequency,
-        'start_hour': start_hour,
-        'end_hour': end_hour,
-        'start_time_str': start_time_raw,
-        'end_time_str': end_time_raw
-    }
-
-    # Load existing recurring definitions JSON
-    defs_json = load_recurring_definitions_from_db(user_id)
-    if defs_json:
-        try:
-            appts = json.loads(defs_json)
-        except:
-            appts = []
-    else:
-        appts = []
-    appts.append(new_appt)
-    # Save back
+    # Insert the single new row
     try:
-        save_recurring_definitions_to_db(user_id, json.dumps(appts))
-    except Exception:
+        add_recurring_definition_to_db(user_id, new_appt)
+    except sqlite3.Error:
         app.logger.exception("Failed to save new recurring appointment")
         if request.is_json:
-            return jsonify({'error': 'Failed to persist new appointment'}), 500
+            return json_response({'error': 'Failed to persist new appointment'}, 500)
         flash("Failed to persist new recurring appointment.", "error")
-    # Update in-memory
-    # Recompute patterns too
-    from datetime import datetime as _dt  # if needed
-    weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals_order = ['First','Second','Third','Fourth','Fifth']
-    patterns = []
-    seen = set()
-    for a in appts:
-        label = f"{a.get('frequency')} {a.get('day')}"
-        if label not in seen:
-            seen.add(label)
-            patterns.append({'label': label, 'frequency': a.get('frequency'), 'day': a.get('day')})
-    patterns.sort(key=lambda p: (ordinals_order.index(p['frequency']), weekdays_order.index(p['day'])))
-
-    if user_id in data_store:
-        data_store[user_id]['recurring'] = {
-            'appointments': appts,
-            'patterns': patterns
-        }
+    # Update in-memory store if loaded; otherwise recurring_schedule
+    # reloads the definitions from the DB
+    store = data_store.get(user_id)
+    if store and 'recurring' in store:
+        store['recurring']['appointments'].append(new_appt)
+        # Patterns only change when this is a new frequency/day combination;
+        # insert it at its sorted position instead of recomputing them all
+        patterns = store['recurring']['patterns']
+        if not any(p['frequency'] == frequency and p['day'] == day for p in patterns):
+            bisect.insort(
+                patterns, {'label': f"{frequency} {day}", 'frequency': frequency, 'day': day},
+                key=lambda p: (ORDINAL_RANK[p['frequency']], WEEKDAY_RANK[p['day']])
+            )
     if request.is_json:
-        return jsonify({'success': True, 'new_appt': new_appt})
+        return json_response({'success': True, 'new_appt': new_appt})
     flash("Added new recurring appointment.", "info")
     return redirect(url_for('recurring_schedule'))
 # ----------------------
@@ -527,65 +1253,32 @@ def edit_specific_appointment():
     """
     user_id = current_user.id
     data = request.get_json()
-    if not isinstance(data, dict) or 'id' not in data:
-        return jsonify({'error': 'Invalid payload'}), 400
+    if not isinstance(data, dict) or not isinstance(data.get('id'), str):
+        return json_response({'error': 'Invalid payload'}, 400)
+    # Blank weights default to 0 for new appointments; an edit must send both
+    if data.get('min_weight') is None or data.get('max_weight') is None:
+        return json_response({'error': 'All fields required'}, 400)
     appt_id = data['id']
-    # Load definitions from DB
-    defs_json = load_specific_definitions_from_db(user_id)
-    if not defs_json:
-        return jsonify({'error': 'No definitions found'}), 400
-    try:
-        appointments = json.loads(defs_json)
-    except:
-        return jsonify({'error': 'Failed to parse definitions'}), 500
-
-    # Find and update
-    updated_appt = None
-    for appt in appointments:
-        if appt.get('id') == appt_id:
-            # Validate required fields
-            try:
-                agency_number = str(data.get('agency_number','')).strip()
-                account_name = str(data.get('account_name','')).strip()
-                area = str(data.get('area','')).strip()
-                min_w = data.get('min_weight')
-                max_w = data.get('max_weight')
-                start_time = data.get('start_time')
-                end_time   = data.get('end_time')
-                if not agency_number or not account_name or not area \
-                   or min_w is None or max_w is None \
-                   or not start_time or not end_time:
-                    return jsonify({'error': 'All fields required'}), 400
-                st_dt = pd.to_datetime(start_time)
-                et_dt = pd.to_datetime(end_time)
-                if et_dt <= st_dt:
-                    return jsonify({'error': 'End Time must be after Start Time'}), 400
-                start_iso = st_dt.isoformat()
-                end_iso   = et_dt.isoformat()
-                start_hour = st_dt.hour + st_dt.minute/60.0
-            except Exception as e:
-                return jsonify({'error': f'Invalid data: {e}'}), 400
-            # Apply updates
-            appt.update({
-                'agency_number': agency_number,
-                'account_name': account_name,
-                'area': area,
-                'min_weight': min_w,
-                'max_weight': max_w,
-                'start_time': start_iso,
-                'end_time': end_iso,
-                'start_hour': start_hour
-            })
-            updated_appt = appt
-            break
-    if updated_appt is None:
-        return jsonify({'error': 'Appointment ID not found'}), 404
+    updated_appt, errors = build_specific_appointment(
+        str(data.get('agency_number', '')).strip(),
+        str(data.get('account_name', '')).strip(),
+        str(data.get('area', '')).strip(),
+        str(data.get('min_weight', '')).strip(),
+        str(data.get('max_weight', '')).strip(),
+        str(data.get('start_time', '')).strip(),
+        str(data.get('end_time', '')).strip(),
+        appt_id=appt_id
+    )
+    if errors:
+        return json_response({'error': '; '.join(errors)}, 400)
 
-    # Save back to DB
+    # Update the single row
     try:
-        save_specific_definitions_to_db(user_id, json.dumps(appointments))
-    except:
-        return jsonify({'error': 'Failed to save changes'}), 500
+        found = update_specific_definition_in_db(user_id, updated_appt)
+    except sqlite3.Error:
+        return json_response({'error': 'Failed to save changes'}, 500)
+    if not found:
+        return json_response({'error': 'Appointment ID not found'}, 404)
 
     # Update in-memory store if loaded
     store = data_store.get(user_id)
@@ -595,7 +1288,7 @@ def edit_specific_appointment():
                 store['appointments'][i] = updated_appt
                 break
 
-    return jsonify({'success': True, 'updated_appt': updated_appt})
+    return json_response({'success': True, 'updated_appt': updated_appt})
 
 
 @app.route('/delete_specific_appointment', methods=['POST'])
@@ -607,49 +1300,23 @@ def delete_specific_appointment():
     """
     user_id = current_user.id
     data = request.get_json()
-    if not isinstance(data, dict) or 'id' not in data:
-        return jsonify({'error': 'Invalid payload'}), 400
+    if not isinstance(data, dict) or not isinstance(data.get('id'), str):
+        return json_response({'error': 'Invalid payload'}, 400)
     appt_id = data['id']
-    defs_json = load_specific_definitions_from_db(user_id)
-    if not defs_json:
-        return jsonify({'error': 'No definitions found'}), 400
+    # Delete the row together with any saved schedule assignments of this ID
     try:
-        appointments = json.loads(defs_json)
-    except:
-        return jsonify({'error': 'Failed to parse definitions'}), 500
-
-    new_apps = [a for a in appointments if a.get('id') != appt_id]
-    if len(new_apps) == len(appointments):
-        return jsonify({'error': 'Appointment ID not found'}), 404
-
-    # Save updated definitions
-    try:
-        save_specific_definitions_to_db(user_id, json.dumps(new_apps))
-    except:
-        return jsonify({'error': 'Failed to delete appointment'}), 500
+        found = delete_specific_definition_from_db(user_id, appt_id)
+    except sqlite3.Error:
+        return json_response({'error': 'Failed to delete appointment'}, 500)
+    if not found:
+        return json_response({'error': 'Appointment ID not found'}, 404)
 
     # Update in-memory
     store = data_store.get(user_id)
     if store and 'appointments' in store:
         store['appointments'] = [a for a in store['appointments'] if a.get('id') != appt_id]
 
-    # Clean up any saved schedule assignments containing this ID
-    saved = load_specific_schedule_from_db(user_id)
-    if saved:
-        try:
-            assignments = json.loads(saved)
-            modified = False
-            for date_str, slots in assignments.items():
-                for slotKey, id_list in slots.items():
-                    if appt_id in id_list:
-                        id_list[:] = [i for i in id_list if i != appt_id]
-                        modified = True
-            if modified:
-                save_specific_schedule_to_db(user_id, json.dumps(assignments))
-        except:
-            pass
-
-    return jsonify({'success': True})
+    return json_response({'success': True})
 
 
 @app.route('/edit_recurring_appointment', methods=['POST'])
@@ -673,69 +1340,34 @@ def edit_recurring_appointment():
     """
     user_id = current_user.id
     data = request.get_json()
-    if not isinstance(data, dict) or 'id' not in data:
-        return jsonify({'error': 'Invalid payload'}), 400
+    if not isinstance(data, dict) or not isinstance(data.get('id'), str):
+        return json_response({'error': 'Invalid payload'}, 400)
+    # Blank weights default to 0 for new appointments; an edit must send both
+    if data.get('min_weight') is None or data.get('max_weight') is None:
+        return json_response({'error': 'All fields required and valid'}, 400)
     appt_id = data['id']
-    defs_json = load_recurring_definitions_from_db(user_id)
-    if not defs_json:
-        return jsonify({'error': 'No definitions found'}), 400
-    try:
-        appointments_rec = json.loads(defs_json)
-    except:
-        return jsonify({'error': 'Failed to parse definitions'}), 500
-
-    weekdays = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals = ['First','Second','Third','Fourth','Fifth']
-    updated_appt = None
-    for appt in appointments_rec:
-        if appt.get('id') == appt_id:
-            try:
-                agency_number = str(data.get('agency_number','')).strip()
-                account_name  = str(data.get('account_name','')).strip()
-                area          = str(data.get('area','')).strip()
-                min_w         = data.get('min_weight')
-                max_w         = data.get('max_weight')
-                day           = str(data.get('day','')).strip()
-                frequency     = str(data.get('frequency','')).strip()
-                st_str        = data.get('start_time_str','')
-                et_str        = data.get('end_time_str','')
-                if not agency_number or not account_name or not area \
-                   or min_w is None or max_w is None \
-                   or day not in weekdays or frequency not in ordinals \
-                   or not st_str or not et_str:
-                    return jsonify({'error': 'All fields required and valid'}), 400
-                st_dt = pd.to_datetime(st_str, format='%H:%M')
-                et_dt = pd.to_datetime(et_str, format='%H:%M')
-                start_hour = st_dt.hour + st_dt.minute/60.0
-                end_hour   = et_dt.hour + et_dt.minute/60.0
-                if not (end_hour > start_hour):
-                    return jsonify({'error': 'End Time must be after Start Time'}), 400
-            except Exception as e:
-                return jsonify({'error': f'Invalid data: {e}'}), 400
-            # Update fields
-            appt.update({
-                'agency_number': agency_number,
-                'account_name': account_name,
-                'area': area,
-                'min_weight': min_w,
-                'max_weight': max_w,
-                'day': day,
-                'frequency': frequency,
-                'start_time_str': st_str,
-                'end_time_str': et_str,
-                'start_hour': start_hour,
-                'end_hour': end_hour
-            })
-            updated_appt = appt
-            break
-    if updated_appt is None:
-        return jsonify({'error': 'Appointment ID not found'}), 404
-
-    # Save back
+    updated_appt, errors = build_recurring_appointment(
+        str(data.get('agency_number', '')).strip(),
+        str(data.get('account_name', '')).strip(),
+        str(data.get('area', '')).strip(),
+        str(data.get('min_weight', '')).strip(),
+        str(data.get('max_weight', '')).strip(),
+        str(data.get('day', '')).strip(),
+        str(data.get('frequency', '')).strip(),
+        str(data.get('start_time_str', '')).strip(),
+        str(data.get('end_time_str', '')).strip(),
+        appt_id=appt_id
+    )
+    if errors:
+        return json_response({'error': '; '.join(errors)}, 400)
+
+    # Update the single row
     try:
-        save_recurring_definitions_to_db(user_id, json.dumps(appointments_rec))
-    except:
-        return jsonify({'error': 'Failed to save changes'}), 500
+        found = update_recurring_definition_in_db(user_id, updated_appt)
+    except sqlite3.Error:
+        return json_response({'error': 'Failed to save changes'}, 500)
+    if not found:
+        return json_response({'error': 'Appointment ID not found'}, 404)
 
     # Update in-memory
     store = data_store.get(user_id)
@@ -746,19 +1378,9 @@ def edit_recurring_appointment():
                 apps[i] = updated_appt
                 break
         # Recompute patterns if day/frequency changed:
-        weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-        ordinals_order = ['First','Second','Third','Fourth','Fifth']
-        patterns_new = []
-        seen = set()
-        for a in store['recurring']['appointments']:
-            label = f"{a['frequency']} {a['day']}"
-            if label not in seen:
-                seen.add(label)
-                patterns_new.append({'label': label, 'frequency': a['frequency'], 'day': a['day']})
-        patterns_new.sort(key=lambda p: (ordinals_order.index(p['frequency']), weekdays_order.index(p['day'])))
-        store['recurring']['patterns'] = patterns_new
+        store['recurring']['patterns'] = build_patterns(store['recurring']['appointments'])
 
-    return jsonify({'success': True, 'updated_appt': updated_appt})
+    return json_response({'success': True, 'updated_appt': updated_appt})
 
 
 @app.route('/delete_recurring_appointment', methods=['POST'])
@@ -770,60 +1392,33 @@ def delete_recurring_appointment():
     """
     user_id = current_user.id
     data = request.get_json()
-    if not isinstance(data, dict) or 'id' not in data:
-        return jsonify({'error': 'Invalid payload'}), 400
+    if not isinstance(data, dict) or not isinstance(data.get('id'), str):
+        return json_response({'error': 'Invalid payload'}, 400)
     appt_id = data['id']
-    defs_json = load_recurring_definitions_from_db(user_id)
-    if not defs_json:
-        return jsonify({'error': 'No definitions found'}), 400
-    try:
-        appointments_rec = json.loads(defs_json)
-    except:
-        return jsonify({'error': 'Failed to parse definitions'}), 500
-
-    new_apps = [a for a in appointments_rec if a.get('id') != appt_id]
-    if len(new_apps) == len(appointments_rec):
-        return jsonify({'error': 'Appointment ID not found'}), 404
-
+    # Delete the row together with any saved schedule assignments of this ID
     try:
-        save_recurring_definitions_to_db(user_id, json.dumps(new_apps))
-    except:
-        return jsonify({'error': 'Failed to delete appointment'}), 500
+        found = delete_recurring_definition_from_db(user_id, appt_id)
+    except sqlite3.Error:
+        return json_response({'error': 'Failed to delete appointment'}, 500)
+    if not found:
+        return json_response({'error': 'Appointment ID not found'}, 404)
 
     # Update in-memory
     store = data_store.get(user_id)
     if store and 'recurring' in store:
+        old_apps = store['recurring']['appointments']
+        removed = next((a for a in old_apps if a.get('id') == appt_id), None)
+        new_apps = [a for a in old_apps if a.get('id') != appt_id]
         store['recurring']['appointments'] = new_apps
+        # Patterns are unchanged while another appointment keeps the label
+        if removed is not None and any(
+                a['day'] == removed['day'] and a['frequency'] == removed['frequency']
+                for a in new_apps):
+            return json_response({'success': True})
         # Recompute patterns
-        weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-        ordinals_order = ['First','Second','Third','Fourth','Fifth']
-        patterns_new = []
-        seen = set()
-        for a in new_apps:
-            label = f"{a['frequency']} {a['day']}"
-            if label not in seen:
-                seen.add(label)
-                patterns_new.append({'label': label, 'frequency': a['frequency'], 'day': a['day']})
-        patterns_new.sort(key=lambda p: (ordinals_order.index(p['frequency']), weekdays_order.index(p['day'])))
-        store['recurring']['patterns'] = patterns_new
-
-    # Clean up saved assignments
-    saved = load_recurring_schedule_from_db(user_id)
-    if saved:
-        try:
-            assignments = json.loads(saved)
-            modified = False
-            for patLabel, slots in assignments.items():
-                for slotKey, id_list in slots.items():
-                    if appt_id in id_list:
-                        id_list[:] = [i for i in id_list if i != appt_id]
-                        modified = True
-            if modified:
-                save_recurring_schedule_to_db(user_id, json.dumps(assignments))
-        except:
-            pass
-
-    return jsonify({'success': True})
+        store['recurring']['patterns'] = build_patterns(new_apps)
+
+    return json_response({'success': True})
 # ----------------------
 # Authentication routes
 # ----------------------
@@ -862,6 +1457,8 @@ def login():
             return redirect(request.url)
         user = User.find_by_username(username)
         if user and check_password_hash(user.password_hash, password):
+            if user.needs_rehash():
+                user.set_password(password)
             login_user(user)
             flash("Logged in successfully", "info")
             next_page = request.args.get('next')
@@ -893,6 +1490,60 @@ def index():
 # ----------------------
 # Specific-date scheduling flow
 # ----------------------
+def hour_of_day(col):
+    """
+    Fractional hour (9.5 for 09:30) of each value of a datetime column, NaN
+    for NaT, computed with whole-minute integer arithmetic on the datetime64
+    array rather than through the .dt.hour/.dt.minute accessors.
+    """
+    if col.dtype == object:
+        # Timestamps with differing UTC offsets (see parse_datetime_column)
+        return pd.Series(
+            [np.nan if pd.isna(t) else t.hour + t.minute/60.0 for t in col], index=col.index
+        )
+    if col.dt.tz is not None:
+        # Keep the wall-clock time, not its UTC equivalent
+        col = col.dt.tz_localize(None)
+    minutes = col.to_numpy().astype('datetime64[m]').astype('int64') % 1440
+    return pd.Series(np.where(col.isna(), np.nan, minutes / 60.0), index=col.index)
+
+def parse_datetime_column(col, format=None):
+    """
+    Parse a text column into datetimes (NaT where invalid). The column is
+    parsed in one pass with format, or else the format pandas infers from
+    its first value; values written another way fall back to pandas'
+    per-value parser instead of being dropped.
+
+    Values with differing UTC offsets, or with and without one, don't fit a
+    single datetime64 column; they are returned as an object column of
+    Timestamps, each keeping its own offset.
+    """
+    try:
+        parsed = pd.to_datetime(col, format=format, errors='coerce')
+        other = parsed.isna() & col.notna()
+        if other.any():
+            parsed[other] = col[other].map(lambda v: pd.to_datetime(v, errors='coerce'))
+        return parsed
+    except (ValueError, TypeError):
+        return col.map(lambda v: pd.to_datetime(v, errors='coerce'), na_action='ignore')
+
+def read_upload_csv(file, text_columns):
+    """
+    Read an uploaded CSV with pandas' C parser in a single pass. text_columns
+    are read as strings, so the parser does not infer (and later convert)
+    their types, and values like agency numbers keep their exact text.
+    """
+    return pd.read_csv(file, dtype={c: str for c in text_columns}, low_memory=False)
+
+def weight_values(col):
+    """
+    Values of a weight column as Python scalars. Whole-number columns are
+    turned into floats, as they read back from the REAL weight columns.
+    """
+    if pd.api.types.is_integer_dtype(col):
+        col = col.astype('float64')
+    return col.tolist()
+
 @app.route('/upload_specific', methods=['GET', 'POST'])
 @login_required
 def upload_specific():
@@ -915,7 +1566,9 @@ def upload_specific():
             flash("No selected file", "error")
             return redirect(request.url)
         try:
-            df = pd.read_csv(file, parse_dates=['Start Time', 'End Time'])
+            df = read_upload_csv(
+                file, ['Agency Number', 'Account Name', 'Area', 'Start Time', 'End Time']
+            )
         except Exception as e:
             flash(f"Failed to read CSV: {e}", "error")
             return redirect(request.url)
@@ -932,43 +1585,45 @@ def upload_specific():
         if missing:
             flash(f"Missing required columns: {missing}", "error")
             return redirect(request.url)
-        appointments = []
-        for idx, row in df.iterrows():
-            st = row['Start Time']
-            et = row['End Time']
-            if not pd.notnull(st) or not pd.notnull(et):
-                continue
-            try:
-                start_iso = pd.to_datetime(st).isoformat()
-                end_iso = pd.to_datetime(et).isoformat()
-                start_dt = pd.to_datetime(st)
-                start_hour = start_dt.hour + start_dt.minute/60.0
-            except:
-                continue
-            appointments.append({
-                'id': str(uuid.uuid4()),
-                'agency_number': str(row['Agency Number']),
-                'account_name': str(row['Account Name']),
-                'area': str(row['Area']),
-                'min_weight': row['Minimum Weight'],
-                'max_weight': row['Maximum Weight'],
-                'start_time': start_iso,
-                'end_time': end_iso,
+        # Parse and derive whole columns at once; rows whose times do not
+        # parse are skipped. tolist() also yields plain Python scalars, which
+        # sqlite3 binds correctly (numpy integers would be stored as blobs).
+        start = parse_datetime_column(df['Start Time'])
+        end = parse_datetime_column(df['End Time'])
+        valid = start.notna() & end.notna()
+        df, start, end = df[valid], start[valid], end[valid]
+        start_hours = hour_of_day(start).tolist()
+        appointments = [
+            {
+                'id': appt_id,
+                'agency_number': str(agency_number),
+                'account_name': str(account_name),
+                'area': str(area),
+                'min_weight': min_w,
+                'max_weight': max_w,
+                'start_time': st.isoformat(),
+                'end_time': et.isoformat(),
                 'start_hour': start_hour
-            })
+            }
+            for appt_id, agency_number, account_name, area, min_w, max_w, st, et, start_hour in zip(
+                new_ids(len(df)),
+                df['Agency Number'].tolist(), df['Account Name'].tolist(), df['Area'].tolist(),
+                weight_values(df['Minimum Weight']), weight_values(df['Maximum Weight']),
+                start, end, start_hours
+            )
+        ]
         if not appointments:
             flash("No valid appointments found in CSV.", "error")
             return redirect(request.url)
         # Persist definitions
-        defs_json = json.dumps(appointments)
-        save_specific_definitions_to_db(user_id, defs_json)
+        save_specific_definitions_to_db(user_id, appointments)
         # Load into in-memory store
         data_store[user_id] = {
             'appointments': appointments,
             'config': {}
         }
         # Optionally clear previous saved schedule:
-        # save_specific_schedule_to_db(user_id, "{}")
+        # save_specific_schedule_to_db(user_id, {})
         flash("Upload successful; definitions saved. Now choose date range.", "info")
         return redirect(url_for('configure'))
     # GET
@@ -982,15 +1637,10 @@ def use_existing_specific():
     Load previously uploaded specific-date definitions into memory and go to configure.
     """
     user_id = current_user.id
-    defs_json = load_specific_definitions_from_db(user_id)
-    if not defs_json:
+    appointments = load_specific_definitions_from_db(user_id)
+    if not appointments:
         flash("No existing upload found. Please upload a file.", "error")
         return redirect(url_for('upload_specific'))
-    try:
-        appointments = json.loads(defs_json)
-    except:
-        flash("Failed to load existing definitions; please upload again.", "error")
-        return redirect(url_for('upload_specific'))
     data_store[user_id] = {
         'appointments': appointments,
         'config': {}
@@ -998,83 +1648,6 @@ def use_existing_specific():
     flash("Loaded existing recurring definitions. You can continue assigning.", "info")
     return redirect(url_for('recurring_schedule'))
 
-    if not new_defs:
-        flash("No valid recurring definitions found in CSV.", "error")
-        return redirect(url_for('recurring_upload'))
-
-    existing_json = load_recurring_definitions_from_db(user_id)
-    if existing_json:
-        try:
-            existing_defs = json.loads(existing_json)
-        except Exception:
-            existing_defs = []
-    else:
-        existing_defs = []
-
-    replaced_ids = set()
-    for new_rec in new_defs:
-        match_idx = -1
-        for i, rec in enumerate(existing_defs):
-            if (rec.get('agency_number') == new_rec['agency_number'] and
-                rec.get('account_name') == new_rec['account_name'] and
-                rec.get('day') == new_rec['day'] and
-                rec.get('frequency') == new_rec['frequency']):
-                match_idx = i
-                break
-        if match_idx == -1:
-            existing_defs.append(new_rec)
-            continue
-        old = existing_defs[match_idx]
-        equal_all = all(old.get(k) == new_rec.get(k) for k in new_rec if k != 'id')
-        if equal_all:
-            continue
-        replaced_ids.add(old.get('id'))
-        existing_defs[match_idx] = new_rec
-
-    if replaced_ids:
-        sched_json = load_recurring_schedule_from_db(user_id)
-        if sched_json:
-            try:
-                assignments = json.loads(sched_json)
-            except Exception:
-                assignments = {}
-            modified = False
-            for pat, slots in assignments.items():
-                if not isinstance(slots, dict):
-                    continue
-                for slot_key, id_list in slots.items():
-                    if not isinstance(id_list, list):
-                        continue
-                    new_list = [i for i in id_list if i not in replaced_ids]
-                    if len(new_list) != len(id_list):
-                        assignments[pat][slot_key] = new_list
-                        modified = True
-            if modified:
-                save_recurring_schedule_to_db(user_id, json.dumps(assignments))
-
-    save_recurring_definitions_to_db(user_id, json.dumps(existing_defs))
-
-    weekdays_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    ordinals_order = ['First', 'Second', 'Third', 'Fourth', 'Fifth']
-    patterns = []
-    seen = set()
-    for appt in existing_defs:
-        label = f"{appt['frequency']} {appt['day']}"
-        if label not in seen:
-            seen.add(label)
-            patterns.append({'label': label, 'frequency': appt['frequency'], 'day': appt['day']})
-    patterns.sort(key=lambda p: (ordinals_order.index(p['frequency']), weekdays_order.index(p['day'])))
-
-    data_store[user_id] = {
-        'recurring': {
-            'appointments': existing_defs,
-            'patterns': patterns
-        }
-    }
-
-    flash("Recurring definitions merged successfully.", "info")
-    return redirect(url_for('recurring_schedule'))
-
 @app.route('/configure', methods=['GET', 'POST'])
 @login_required
 def configure():
@@ -1096,7 +1669,7 @@ def configure():
         try:
             dt_start = datetime.fromisoformat(date_start).date()
             dt_end = datetime.fromisoformat(date_end).date()
-        except Exception as e:
+        except ValueError as e:
             flash(f"Invalid date format: {e}", "error")
             return redirect(request.url)
         if dt_end < dt_start:
@@ -1129,15 +1702,12 @@ def schedule():
     store = data_store.get(user_id)
 
     # Auto-load definitions if missing
-    if (store is None or 'appointments' not in store) and load_specific_definitions_from_db(user_id):
-        try:
-            defs_json = load_specific_definitions_from_db(user_id)
-            appointments = json.loads(defs_json)
-        except:
-            appointments = []
-        data_store[user_id] = {'appointments': appointments, 'config': {}}
-        flash("Loaded your previously uploaded appointments. Please choose date range.", "info")
-        return redirect(url_for('configure'))
+    if store is None or 'appointments' not in store:
+        appointments = load_specific_definitions_from_db(user_id)
+        if appointments:
+            data_store[user_id] = {'appointments': appointments, 'config': {}}
+            flash("Loaded your previously uploaded appointments. Please choose date range.", "info")
+            return redirect(url_for('configure'))
 
     # Now require both appointments and config
     store = data_store.get(user_id)
@@ -1150,13 +1720,7 @@ def schedule():
     dates = cfg.get('dates', [])
 
     # Load saved assignments if any
-    saved_json_str = load_specific_schedule_from_db(user_id)
-    saved_assignments = None
-    if saved_json_str:
-        try:
-            saved_assignments = json.loads(saved_json_str)
-        except:
-            saved_assignments = None
+    saved_assignments = load_specific_schedule_from_db(user_id) or None
 
     return render_template(
         'schedule.html',
@@ -1187,32 +1751,30 @@ def save_schedule():
     # We may not need in-memory store[`config`] here, since we persist by saved JSON.
     # But we still require definitions exist:
     # Attempt to load definitions if not in memory:
-    if (store is None or 'appointments' not in store) and load_specific_definitions_from_db(user_id):
-        try:
-            defs_json = load_specific_definitions_from_db(user_id)
-            appointments = json.loads(defs_json)
-        except:
-            appointments = []
-        store = {'appointments': appointments, 'config': {}}
-        data_store[user_id] = store
+    if store is None or 'appointments' not in store:
+        appointments = load_specific_definitions_from_db(user_id)
+        if appointments:
+            store = {'appointments': appointments, 'config': {}}
+            data_store[user_id] = store
 
     if store is None or 'appointments' not in store:
-        return jsonify({'error': 'No appointment definitions found'}), 400
+        return json_response({'error': 'No appointment definitions found'}, 400)
 
     data = request.get_json()
     if not isinstance(data, dict):
-        return jsonify({'error': 'Invalid JSON'}), 400
+        return json_response({'error': 'Invalid JSON'}, 400)
+    if not assignment_ids_valid(data):
+        return json_response({'error': 'Appointment IDs must be strings'}, 400)
 
-    # Persist assignments JSON
+    # Persist assignments
     try:
-        json_str = json.dumps(data)
-        save_specific_schedule_to_db(user_id, json_str)
+        save_specific_schedule_to_db(user_id, data)
         app.logger.info(f"Saved specific schedule for user {user_id}")
-    except Exception:
+    except sqlite3.Error:
         app.logger.exception("Failed to save specific schedule to DB")
-        return jsonify({'error': 'Failed to save schedule'}), 500
+        return json_response({'error': 'Failed to save schedule'}, 500)
 
-    return jsonify({'success': True})
+    return json_response({'success': True})
 
 @app.route('/download_schedule', methods=['GET'])
 @login_required
@@ -1223,82 +1785,118 @@ def download_schedule():
     """
     user_id = current_user.id
 
-    # Load definitions from DB
-    defs_json = load_specific_definitions_from_db(user_id)
-    if not defs_json:
+    # Load definitions from DB, indexed by id
+    appt_lookup = load_specific_definitions_by_id(user_id)
+    if not appt_lookup:
         return flash("No appointment definitions found. Please upload first.", "error") or redirect(url_for('upload_specific'))
 
-    try:
-        appointments = json.loads(defs_json)
-    except:
-        flash("Failed to load appointment definitions.", "error")
-        return redirect(url_for('upload_specific'))
-
-    # Load saved assignments JSON
-    saved_json_str = load_specific_schedule_from_db(user_id)
-    if not saved_json_str:
+    # Load saved assignments
+    assignments = load_specific_schedule_from_db(user_id)
+    if not assignments:
         flash("No saved schedule found. Please arrange and click Save first.", "error")
         return redirect(url_for('schedule'))
 
-    try:
-        assignments = json.loads(saved_json_str)
-    except:
-        flash("Failed to load saved schedule.", "error")
-        return redirect(url_for('schedule'))
-
-    # Build a lookup from appointment id to data
-    appt_lookup = {appt['id']: appt for appt in appointments}
-
-    out_rows = []
-    for date_str, slots_dict in assignments.items():
-        if not isinstance(slots_dict, dict):
-            continue
-        for slot_key, appt_ids in slots_dict.items():
-            if not isinstance(appt_ids, list):
-                continue
-            parts = slot_key.rsplit('_', 1)
-            if len(parts) == 2:
-                truck_name, slot_label = parts
-            else:
-                truck_name = slot_key
-                slot_label = ""
-            for aid in appt_ids:
-                appt = appt_lookup.get(aid)
-                if not appt:
-                    continue
-                out_rows.append({
-                    'Date': date_str,
-                    'Truck Name': truck_name,
-                    'Slot': slot_label,
-                    'Agency Number': appt['agency_number'],
-                    'Account Name': appt['account_name'],
-                    'Area': appt['area'],
-                    'Minimum Weight': appt['min_weight'],
-                    'Maximum Weight': appt['max_weight'],
-                    'Start Time': appt['start_time'],
-                    'End Time': appt['end_time']
-                })
-    if not out_rows:
+    def schedule_rows():
+        # Saved assignments are rebuilt from rows (assignments_from_rows), so
+        # their shape needs no checking here
+        for date_str, slots_dict in assignments.items():
+            for slot_key, appt_ids in slots_dict.items():
+                truck_name, slot_label = split_slot_key(slot_key)
+                for aid in appt_ids:
+                    appt = appt_lookup.get(aid)
+                    if not appt:
+                        continue
+                    yield (
+                        date_str, truck_name, slot_label,
+                        appt['agency_number'], appt['account_name'], appt['area'],
+                        appt['min_weight'], appt['max_weight'],
+                        appt['start_time'], appt['end_time']
+                    )
+
+    # Peek so an empty schedule can still redirect before streaming starts
+    rows = schedule_rows()
+    first = next(rows, None)
+    if first is None:
         flash("No appointments scheduled to download.", "error")
         return redirect(url_for('schedule'))
 
-    df_out = pd.DataFrame(out_rows)
     cols = ['Date','Truck Name','Slot','Agency Number','Account Name','Area','Minimum Weight','Maximum Weight','Start Time','End Time']
-    df_out = df_out[cols]
-    csv_text = df_out.to_csv(index=False)
-    buf = BytesIO(csv_text.encode('utf-8'))
-    buf.seek(0)
-    return send_file(
-        buf,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='scheduled_routes.csv'
-    )
+    return csv_response(cols, itertools.chain([first], rows), 'scheduled_routes.csv')
 
 
 # ----------------------
 # Recurring scheduling flow
 # ----------------------
+# Columns of a recurring CSV read as text; times are parsed by parse_time_column
+RECURRING_CSV_TEXT_COLUMNS = (
+    'Agency Number', 'Account Name', 'Area', 'Day', 'Frequency', 'Start Time', 'End Time'
+)
+
+def parse_time_column(col):
+    """
+    Parse a column of clock times into datetimes (NaT where invalid).
+    "HH:MM" values, the format of the templates, are parsed in one pass.
+    """
+    parsed = parse_datetime_column(col, format='%H:%M')
+    if parsed.dtype == object:
+        # Clock times with differing UTC offsets: keep their wall-clock time
+        parsed = pd.to_datetime(parsed.map(lambda t: t.replace(tzinfo=None), na_action='ignore'))
+    return parsed
+
+def recurring_rows_from_frame(df):
+    """
+    Validate and convert the rows of an uploaded recurring CSV using
+    whole-column operations. Returns (list of appointment dicts without
+    IDs, None), or (None, (row index, message)) for the first invalid row.
+    """
+    day = df['Day'].astype(str).str.strip()
+    frequency = df['Frequency'].astype(str).str.strip()
+    start = parse_time_column(df['Start Time'])
+    end = parse_time_column(df['End Time'])
+    start_hour = hour_of_day(start)
+    end_hour = hour_of_day(end)
+
+    bad_day = ~day.isin(WEEKDAYS)
+    bad_frequency = ~frequency.isin(ORDINALS)
+    bad_time = start.isna() | end.isna()
+    bad = bad_day | bad_frequency | bad_time | ~(end_hour > start_hour)
+    if bad.any():
+        pos = int(bad.to_numpy().argmax())
+        idx = df.index[pos]
+        if bad_day.iloc[pos]:
+            message = f"Invalid Day '{day.iloc[pos]}'. Must be one of {WEEKDAYS}."
+        elif bad_frequency.iloc[pos]:
+            message = f"Invalid Frequency '{frequency.iloc[pos]}'. Must be one of {ORDINALS}."
+        elif bad_time.iloc[pos]:
+            message = (f"Cannot parse Start/End Time "
+                       f"'{df['Start Time'].iloc[pos]}'/'{df['End Time'].iloc[pos]}'.")
+        else:
+            message = "End Time must be after Start Time."
+        return None, (idx, message)
+
+    rows = [
+        {
+            'agency_number': str(agency_number),
+            'account_name': str(account_name),
+            'area': str(area),
+            'min_weight': min_w,
+            'max_weight': max_w,
+            'day': sys.intern(d),
+            'frequency': sys.intern(f),
+            'start_hour': sh,
+            'end_hour': eh,
+            'start_time_str': st_str,
+            'end_time_str': et_str
+        }
+        for agency_number, account_name, area, min_w, max_w, d, f, sh, eh, st_str, et_str in zip(
+            df['Agency Number'].tolist(), df['Account Name'].tolist(), df['Area'].tolist(),
+            weight_values(df['Minimum Weight']), weight_values(df['Maximum Weight']),
+            day.tolist(), frequency.tolist(), start_hour.tolist(), end_hour.tolist(),
+            start.dt.strftime('%H:%M').tolist(), end.dt.strftime('%H:%M').tolist()
+        )
+    ]
+    return rows, None
+
 @app.route('/recurring_upload', methods=['GET', 'POST'])
 @login_required
 def recurring_upload():
@@ -1322,7 +1920,7 @@ def recurring_upload():
             flash("No selected file", "error")
             return redirect(request.url)
         try:
-            df = pd.read_csv(file)
+            df = read_upload_csv(file, RECURRING_CSV_TEXT_COLUMNS)
         except Exception as e:
             flash(f"Failed to read CSV: {e}", "error")
             return redirect(request.url)
@@ -1335,73 +1933,20 @@ def recurring_upload():
         if missing:
             flash(f"Missing required columns: {missing}", "error")
             return redirect(request.url)
-        appointments_rec = []
-        weekdays = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-        ordinals = ['First','Second','Third','Fourth','Fifth']
-        for idx, row in df.iterrows():
-            try:
-                agency_number = str(row['Agency Number'])
-                account_name = str(row['Account Name'])
-                area = str(row['Area'])
-                min_w = row['Minimum Weight']
-                max_w = row['Maximum Weight']
-                day = str(row['Day']).strip()
-                frequency = str(row['Frequency']).strip()
-                st_raw = row['Start Time']
-                et_raw = row['End Time']
-            except Exception:
-                continue
-            if day not in weekdays:
-                flash(f"Row {idx+2}: Invalid Day '{day}'. Must be one of {weekdays}.", "error")
-                return redirect(request.url)
-            if frequency not in ordinals:
-                flash(f"Row {idx+2}: Invalid Frequency '{frequency}'. Must be one of {ordinals}.", "error")
-                return redirect(request.url)
-            # Parse times
-            try:
-                st_dt = pd.to_datetime(st_raw)
-                et_dt = pd.to_datetime(et_raw)
-                start_hour = st_dt.hour + st_dt.minute/60.0
-                end_hour = et_dt.hour + et_dt.minute/60.0
-                start_time_str = st_dt.strftime('%H:%M')
-                end_time_str = et_dt.strftime('%H:%M')
-            except Exception as e:
-                flash(f"Row {idx+2}: Cannot parse Start/End Time '{st_raw}'/'{et_raw}': {e}", "error")
-                return redirect(request.url)
-            if not (end_hour > start_hour):
-                flash(f"Row {idx+2}: End Time must be after Start Time.", "error")
-                return redirect(request.url)
-            appointments_rec.append({
-                'id': str(uuid.uuid4()),
-                'agency_number': agency_number,
-                'account_name': account_name,
-                'area': area,
-                'min_weight': min_w,
-                'max_weight': max_w,
-                'day': day,
-                'frequency': frequency,
-                'start_hour': start_hour,
-                'end_hour': end_hour,
-                'start_time_str': start_time_str,
-                'end_time_str': end_time_str
-            })
+        appointments_rec, error = recurring_rows_from_frame(df)
+        if error:
+            idx, message = error
+            flash(f"Row {idx+2}: {message}", "error")
+            return redirect(request.url)
+        for appt, appt_id in zip(appointments_rec, new_ids(len(appointments_rec))):
+            appt['id'] = appt_id
         if not appointments_rec:
             flash("No valid recurring definitions found in CSV.", "error")
             return redirect(request.url)
         # Persist definitions
-        defs_json = json.dumps(appointments_rec)
-        save_recurring_definitions_to_db(user_id, defs_json)
+        save_recurring_definitions_to_db(user_id, appointments_rec)
         # Compute patterns
-        patterns = []
-        seen = set()
-        weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-        ordinals_order = ['First','Second','Third','Fourth','Fifth']
-        for appt in appointments_rec:
-            label = f"{appt['frequency']} {appt['day']}"
-            if label not in seen:
-                seen.add(label)
-                patterns.append({'label': label, 'frequency': appt['frequency'], 'day': appt['day']})
-        patterns.sort(key=lambda pat: (ordinals_order.index(pat['frequency']), weekdays_order.index(pat['day'])))
+        patterns = build_patterns(appointments_rec)
         # Store in-memory
         data_store[user_id] = {
             'recurring': {
@@ -1410,7 +1955,7 @@ def recurring_upload():
             }
         }
         # Optionally clear previous recurring schedule:
-        # save_recurring_schedule_to_db(user_id, "{}")
+        # save_recurring_schedule_to_db(user_id, {})
         flash("Recurring upload successful; definitions saved. Now assign patterns.", "info")
         return redirect(url_for('recurring_schedule'))
     # GET
@@ -1424,32 +1969,22 @@ def use_existing_recurring():
     Load previously uploaded recurring definitions into memory and go to recurring_schedule.
     """
     user_id = current_user.id
-    defs_json = load_recurring_definitions_from_db(user_id)
-    if not defs_json:
+    appointments_rec = load_recurring_definitions_from_db(user_id)
+    if not appointments_rec:
         flash("No existing recurring upload found. Please upload a file.", "error")
         return redirect(url_for('recurring_upload'))
-    try:
-        appointments_rec = json.loads(defs_json)
-    except:
-        flash("Failed to load existing definitions; please upload again.", "error")
-        return redirect(url_for('recurring_upload'))
-    # Compute patterns
-    weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals_order = ['First','Second','Third','Fourth','Fifth']
-    patterns = []
-    seen = set()
-    for appt in appointments_rec:
-        label = f"{appt.get('frequency')} {appt.get('day')}"
-        if label not in seen:
-            seen.add(label)
-            patterns.append({'label': label, 'frequency': appt.get('frequency'), 'day': appt.get('day')})
-    patterns.sort(key=lambda pat: (ordinals_order.index(pat['frequency']), weekdays_order.index(pat['day'])))
-    data_store[user_id] = {
-        'recurring': {
-            'appointments': appointments_rec,
-            'patterns': patterns
+    # The loader hands out the same list object until the definitions
+    # change, so a store holding it already has the matching patterns
+    store = data_store.get(user_id)
+    if not (store and 'recurring' in store
+            and store['recurring']['appointments'] is appointments_rec):
+        patterns = list(load_recurring_patterns(user_id))
+        data_store[user_id] = {
+            'recurring': {
+                'appointments': appointments_rec,
+                'patterns': patterns
+            }
         }
-    }
     flash("Loaded existing recurring definitions. You can continue assigning.", "info")
     return redirect(url_for('recurring_schedule'))
 
@@ -1468,7 +2003,7 @@ def upload_recurring_merge():
         flash("No selected file", "error")
         return redirect(url_for('recurring_upload'))
     try:
-        df = pd.read_csv(file)
+        df = read_upload_csv(file, RECURRING_CSV_TEXT_COLUMNS)
     except Exception as e:
         flash(f"Failed to read CSV: {e}", "error")
         return redirect(url_for('recurring_upload'))
@@ -1483,41 +2018,17 @@ def upload_recurring_merge():
         flash(f"Missing required columns: {missing}", "error")
         return redirect(url_for('recurring_upload'))
 
-    weekdays = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals = ['First','Second','Third','Fourth','Fifth']
-    new_rows = []
-    for idx, row in df.iterrows():
-        try:
-            day = str(row['Day']).strip()
-            freq = str(row['Frequency']).strip()
-            if day not in weekdays or freq not in ordinals:
-                raise ValueError
-            st_dt = pd.to_datetime(row['Start Time'])
-            et_dt = pd.to_datetime(row['End Time'])
-            start_hour = st_dt.hour + st_dt.minute/60.0
-            end_hour = et_dt.hour + et_dt.minute/60.0
-            if not (end_hour > start_hour):
-                raise ValueError
-            new_rows.append({
-                'agency_number': str(row['Agency Number']),
-                'account_name': str(row['Account Name']),
-                'area': str(row['Area']),
-                'min_weight': row['Minimum Weight'],
-                'max_weight': row['Maximum Weight'],
-                'day': day,
-                'frequency': freq,
-                'start_hour': start_hour,
-                'end_hour': end_hour,
-                'start_time_str': st_dt.strftime('%H:%M'),
-                'end_time_str': et_dt.strftime('%H:%M')
-            })
-        except Exception:
-            flash(f"Row {idx+2} invalid", "error")
-            return redirect(url_for('recurring_upload'))
+    new_rows, error = recurring_rows_from_frame(df)
+    if error:
+        flash(f"Row {error[0]+2} invalid", "error")
+        return redirect(url_for('recurring_upload'))
 
     # Load existing definitions
-    existing_json = load_recurring_definitions_from_db(user_id)
-    existing = json.loads(existing_json) if existing_json else []
+    existing = load_recurring_definitions_from_db(user_id)
+    # Agency numbers are matched on their exact CSV text. Definitions uploaded
+    # before CSV text columns were read as strings hold pandas' reading of
+    # the number instead (see legacy_agency_number): one written with leading
+    # zeros, like 00123, is stored as 123 and is added again, not replaced.
     def _key(a):
         return (
             a['agency_number'], a['account_name'], a['area'],
@@ -1529,9 +2040,12 @@ def upload_recurring_merge():
     replaced_ids = []
     merged = []
 
+    ids = iter(new_ids(len(new_rows)))
     for row in new_rows:
         k = _key(row)
-        ex = existing_map.get(k)
+        # Only the first CSV row with a key is matched; repeats are added as
+        # new definitions instead of sharing the existing id
+        ex = existing_map.get(k) if k not in processed_keys else None
         if ex:
             processed_keys.add(k)
             identical = (
@@ -1542,10 +2056,10 @@ def upload_recurring_merge():
                 row['id'] = ex['id']
             else:
                 replaced_ids.append(ex['id'])
-                row['id'] = str(uuid.uuid4())
+                row['id'] = next(ids)
             merged.append(row)
         else:
-            row['id'] = str(uuid.uuid4())
+            row['id'] = next(ids)
             merged.append(row)
 
     for ex in existing:
@@ -1556,23 +2070,19 @@ def upload_recurring_merge():
         flash("No valid recurring definitions found in CSV.", "error")
         return redirect(url_for('recurring_upload'))
 
-    try:
-        save_recurring_definitions_to_db(user_id, json.dumps(merged))
-    except Exception:
-        flash("Failed to save merged definitions", "error")
-        return redirect(url_for('recurring_upload'))
+    if merged == existing:
+        # Re-upload of unchanged definitions (every row kept its id, in the
+        # same order): skip the rewrite, which would only bump the version
+        merged = existing
+    else:
+        try:
+            save_recurring_definitions_to_db(user_id, merged)
+        except sqlite3.Error:
+            flash("Failed to save merged definitions", "error")
+            return redirect(url_for('recurring_upload'))
 
     # Recompute patterns
-    weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals_order = ['First','Second','Third','Fourth','Fifth']
-    patterns = []
-    seen = set()
-    for appt in merged:
-        label = f"{appt['frequency']} {appt['day']}"
-        if label not in seen:
-            seen.add(label)
-            patterns.append({'label': label, 'frequency': appt['frequency'], 'day': appt['day']})
-    patterns.sort(key=lambda pat: (ordinals_order.index(pat['frequency']), weekdays_order.index(pat['day'])))
+    patterns = build_patterns(merged)
 
     data_store[user_id] = {
         'recurring': {
@@ -1583,21 +2093,7 @@ def upload_recurring_merge():
 
     # Remove replaced IDs from saved assignments
     if replaced_ids:
-        saved = load_recurring_schedule_from_db(user_id)
-        if saved:
-            try:
-                assignments = json.loads(saved)
-                changed = False
-                for pat, slots in assignments.items():
-                    for slot, id_list in slots.items():
-                        new_list = [i for i in id_list if i not in replaced_ids]
-                        if len(new_list) != len(id_list):
-                            assignments[pat][slot] = new_list
-                            changed = True
-                if changed:
-                    save_recurring_schedule_to_db(user_id, json.dumps(assignments))
-            except Exception:
-                pass
+        remove_recurring_assignments_from_db(user_id, replaced_ids)
 
     flash("Recurring upload merged; new appointments added to Unassigned.", "info")
     return redirect(url_for('recurring_schedule'))
@@ -1613,170 +2109,131 @@ def recurring_schedule():
     store = data_store.get(user_id)
 
     # Auto-load if missing
-    if (store is None or 'recurring' not in store) and load_recurring_definitions_from_db(user_id):
-        try:
-            defs_json = load_recurring_definitions_from_db(user_id)
-            appointments_rec = json.loads(defs_json)
-        except:
-            appointments_rec = []
-        # Compute patterns
-        weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-        ordinals_order = ['First','Second','Third','Fourth','Fifth']
-        patterns = []
-        seen = set()
-        for appt in appointments_rec:
-            label = f"{appt.get('frequency')} {appt.get('day')}"
-            if label not in seen:
-                seen.add(label)
-                patterns.append({'label': label, 'frequency': appt.get('frequency'), 'day': appt.get('day')})
-        patterns.sort(key=lambda pat: (ordinals_order.index(pat['frequency']), weekdays_order.index(pat['day'])))
-        data_store[user_id] = {
-            'recurring': {
-                'appointments': appointments_rec,
-                'patterns': patterns
+    if store is None or 'recurring' not in store:
+        appointments_rec = load_recurring_definitions_from_db(user_id)
+        if appointments_rec:
+            patterns = list(load_recurring_patterns(user_id))
+            data_store[user_id] = {
+                'recurring': {
+                    'appointments': appointments_rec,
+                    'patterns': patterns
+                }
             }
-        }
-        flash("Loaded your previously uploaded recurring definitions. You can continue assigning.", "info")
+            flash("Loaded your previously uploaded recurring definitions. You can continue assigning.", "info")
     # Now require definitions in memory
     store = data_store.get(user_id)
     if store is None or 'recurring' not in store:
         flash("No recurring definitions found. Please upload first.", "error")
         return redirect(url_for('recurring_upload'))
-    recurring = store['recurring']
-    appointments_rec = recurring['appointments']
-    patterns = recurring['patterns']
+
+    # Between deploys the page only changes with the definitions or the
+    # saved schedule, so their versions and the build tag identify it and a
+    # browser revalidating an unchanged page gets a 304 without the
+    # assignments being read or the page rendered
+    etag = (f"{page_build_tag('recurring_schedule.html')}-{user_id}"
+            f"-{load_data_version(user_id, 'recurring_definitions')}"
+            f"-{load_data_version(user_id, 'recurring_schedule')}")
+    # The page is built from the versioned loaders rather than the session
+    # store, which misses writes made through other worker processes. They
+    # are read after the versions, so the tag is never newer than the page.
+    appointments_rec = load_recurring_definitions_from_db(user_id)
+    patterns = load_recurring_patterns(user_id)
     if not patterns:
         flash("No recurrence patterns detected. Ensure CSV has valid Day/Frequency.", "error")
         return redirect(url_for('recurring_upload'))
 
-    # Load saved assignments if any
-    saved_json_str = load_recurring_schedule_from_db(user_id)
-    saved_assignments = None
-    if saved_json_str:
-        try:
-            saved_assignments = json.loads(saved_json_str)
-        except:
-            saved_assignments = None
-
-    return render_template(
-        'recurring_schedule.html',
-        appointments=appointments_rec,
-        patterns=patterns,
-        trucks=FIXED_TRUCKS,
-        slots=SLOT_DEFINITIONS,
-        saved_assignments=saved_assignments
-    )
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        # Load saved assignments if any
+        saved_assignments = load_recurring_schedule_from_db(user_id) or None
+        response = app.make_response(render_template(
+            'recurring_schedule.html',
+            appointments=appointments_rec,
+            patterns=patterns,
+            trucks=FIXED_TRUCKS,
+            slots=SLOT_DEFINITIONS,
+            saved_assignments=saved_assignments
+        ))
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/save_recurring_schedule', methods=['POST'])
 @login_required
 def save_recurring_schedule():
     user_id = current_user.id
-    store = data_store.get(user_id)
-    # (auto-load definitions if needed, similar to specific)
     data = request.get_json()
     if not isinstance(data, dict):
-        return jsonify({'error': 'Invalid JSON format'}), 400
+        return json_response({'error': 'Invalid JSON format'}, 400)
+    if not assignment_ids_valid(data):
+        return json_response({'error': 'Appointment IDs must be strings'}, 400)
     try:
-        json_str = json.dumps(data)
-        save_recurring_schedule_to_db(user_id, json_str)
-    except Exception:
+        save_recurring_schedule_to_db(user_id, data)
+    except sqlite3.Error:
         app.logger.exception("Failed to save recurring schedule to DB")
-        return jsonify({'error': 'Failed to save'}), 500
-    return jsonify({'success': True})
+        return json_response({'error': 'Failed to save'}, 500)
+    return json_response({'success': True})
 
 @app.route('/download_recurring_schedule', methods=['GET'])
 @login_required
 def download_recurring_schedule():
     user_id = current_user.id
-    # Load recurring definitions
-    defs_json = load_recurring_definitions_from_db(user_id)
-    if not defs_json:
+    # Patterns to know valid labels; none means there are no definitions
+    pattern_map = load_recurring_patterns_by_label(user_id)
+    if not pattern_map:
         flash("No recurring definitions found; please upload first.", "error")
         return redirect(url_for('recurring_upload'))
-    try:
-        appointments_rec = json.loads(defs_json)
-    except:
-        flash("Failed to load recurring definitions.", "error")
-        return redirect(url_for('recurring_upload'))
-    # Compute patterns (to know valid labels), or store patterns in DB if previously computed
-    weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    ordinals_order = ['First','Second','Third','Fourth','Fifth']
-    patterns = []
-    seen = set()
-    for appt in appointments_rec:
-        label = f"{appt.get('frequency')} {appt.get('day')}"
-        if label not in seen:
-            seen.add(label)
-            patterns.append({'label': label, 'frequency': appt.get('frequency'), 'day': appt.get('day')})
-    patterns.sort(key=lambda pat: (ordinals_order.index(pat['frequency']), weekdays_order.index(pat['day'])))
-    pattern_map = {p['label']: p for p in patterns}
 
     # Load saved assignments
-    saved_json_str = load_recurring_schedule_from_db(user_id)
-    if not saved_json_str:
+    assignments = load_recurring_schedule_from_db(user_id)
+    if not assignments:
         flash("No saved recurring schedule found. Please assign and Save first.", "error")
         return redirect(url_for('recurring_schedule'))
-    try:
-        assignments = json.loads(saved_json_str)
-    except:
-        flash("Failed to load saved recurring schedule.", "error")
-        return redirect(url_for('recurring_schedule'))
 
-    appt_lookup = {appt['id']: appt for appt in appointments_rec}
-    out_rows = []
-    for pattern_label, slots_dict in assignments.items():
-        if pattern_label not in pattern_map:
-            continue
-        pat = pattern_map[pattern_label]
-        freq = pat['frequency']
-        day = pat['day']
-        if not isinstance(slots_dict, dict):
-            continue
-        for slot_key, appt_ids in slots_dict.items():
-            if not isinstance(appt_ids, list):
+    # Only the definitions the schedule refers to are read, unless the
+    # full index is already memoized
+    # (saved assignments are rebuilt from rows, so their shape is known)
+    needed_ids = {
+        aid
+        for slots_dict in assignments.values()
+        for appt_ids in slots_dict.values()
+        for aid in appt_ids
+    }
+    appt_lookup = load_recurring_definitions_subset(user_id, needed_ids)
+
+    def schedule_rows():
+        for pattern_label, slots_dict in assignments.items():
+            if pattern_label not in pattern_map:
                 continue
-            parts = slot_key.rsplit('_', 1)
-            if len(parts) == 2:
-                truck_name, slot_label = parts
-            else:
-                truck_name = slot_key
-                slot_label = ""
-            for aid in appt_ids:
-                appt = appt_lookup.get(aid)
-                if not appt:
-                    continue
-                out_rows.append({
-                    'Pattern': pattern_label,
-                    'Frequency': freq,
-                    'Day': day,
-                    'Truck Name': truck_name,
-                    'Slot': slot_label,
-                    'Agency Number': appt['agency_number'],
-                    'Account Name': appt['account_name'],
-                    'Area': appt['area'],
-                    'Minimum Weight': appt['min_weight'],
-                    'Maximum Weight': appt['max_weight'],
-                    'Start Time': appt['start_time_str'],
-                    'End Time': appt['end_time_str']
-                })
-    if not out_rows:
+            pat = pattern_map[pattern_label]
+            freq = pat['frequency']
+            day = pat['day']
+            for slot_key, appt_ids in slots_dict.items():
+                truck_name, slot_label = split_slot_key(slot_key)
+                for aid in appt_ids:
+                    appt = appt_lookup.get(aid)
+                    if not appt:
+                        continue
+                    yield (
+                        pattern_label, freq, day, truck_name, slot_label,
+                        appt['agency_number'], appt['account_name'], appt['area'],
+                        appt['min_weight'], appt['max_weight'],
+                        appt['start_time_str'], appt['end_time_str']
+                    )
+
+    # Peek so an empty schedule can still redirect before streaming starts
+    rows = schedule_rows()
+    first = next(rows, None)
+    if first is None:
         flash("No recurring assignments to download.", "error")
         return redirect(url_for('recurring_schedule'))
 
-    df_out = pd.DataFrame(out_rows)
     cols = ['Pattern','Frequency','Day','Truck Name','Slot',
             'Agency Number','Account Name','Area',
             'Minimum Weight','Maximum Weight','Start Time','End Time']
-    df_out = df_out[cols]
-    csv_text = df_out.to_csv(index=False)
-    buf = BytesIO(csv_text.encode('utf-8'))
-    buf.seek(0)
-    return send_file(
-        buf,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='recurring_schedule.csv'
-    )
+    return csv_response(cols, itertools.chain([first], rows), 'recurring_schedule.csv')
 
 
 # ----------------------
@@ -0,0 +1,55 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# Point the app at a scratch database before it is imported (init_db runs on import)
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ.setdefault('SCHEDULES_DB', os.path.join(_tmpdir.name, 'schedules.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as route_planner  # noqa: E402
+
+CSV_HEADER = ("Agency Number,Account Name,Area,Minimum Weight,Maximum Weight,"
+              "Day,Frequency,Start Time,End Time\n")
+
+
+class UploadRecurringMergeTest(unittest.TestCase):
+    def setUp(self):
+        route_planner.app.config['TESTING'] = True
+        self.client = route_planner.app.test_client()
+        self.client.post('/register', data={'username': 'merger', 'password': 'pw', 'password2': 'pw'})
+        self.client.post('/login', data={'username': 'merger', 'password': 'pw'})
+
+    def upload(self, route, csv_text):
+        return self.client.post(
+            route,
+            data={'file': (io.BytesIO(csv_text.encode()), 'recurring.csv')},
+            content_type='multipart/form-data'
+        )
+
+    def stored_appointments(self):
+        with route_planner.app.app_context():
+            user = route_planner.User.find_by_username('merger')
+            return route_planner.select_recurring_definitions(user.id)
+
+    def test_repeated_row_matching_an_existing_definition(self):
+        row = "1,Acme,North,100,200,Monday,First,08:00,09:00\n"
+        self.upload('/recurring_upload', CSV_HEADER + row)
+        (original,) = self.stored_appointments()
+
+        response = self.upload(
+            '/upload_recurring_merge',
+            CSV_HEADER + row + row + "2,Beta,South,100,200,Tuesday,Second,10:00,11:00\n"
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('recurring_schedule', response.location)
+        appointments = self.stored_appointments()
+        self.assertEqual([a['agency_number'] for a in appointments], ['1', '1', '2'])
+        self.assertEqual(appointments[0]['id'], original['id'])
+        self.assertEqual(len({a['id'] for a in appointments}), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
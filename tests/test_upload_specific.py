@@ -0,0 +1,95 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# Point the app at a scratch database before it is imported (init_db runs on import)
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ['SCHEDULES_DB'] = os.path.join(_tmpdir.name, 'schedules.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as route_planner  # noqa: E402
+
+CSV_HEADER = "Agency Number,Account Name,Area,Minimum Weight,Maximum Weight,Start Time,End Time\n"
+
+
+class UploadSpecificTest(unittest.TestCase):
+    def setUp(self):
+        route_planner.app.config['TESTING'] = True
+        self.client = route_planner.app.test_client()
+        self.client.post('/register', data={'username': 'tester', 'password': 'pw', 'password2': 'pw'})
+        self.client.post('/login', data={'username': 'tester', 'password': 'pw'})
+
+    def upload(self, csv_text):
+        return self.client.post(
+            '/upload_specific',
+            data={'file': (io.BytesIO(csv_text.encode()), 'specific.csv')},
+            content_type='multipart/form-data'
+        )
+
+    def stored_appointments(self):
+        with route_planner.app.app_context():
+            user = route_planner.User.find_by_username('tester')
+            return route_planner.select_specific_definitions(user.id)
+
+    def test_mixed_datetime_formats_are_all_kept(self):
+        response = self.upload(
+            CSV_HEADER
+            + "1,Acme,North,100,200,2024-01-02 09:00,2024-01-02 10:00\n"
+            + "2,Beta,South,100,200,1/3/2024 9:30,1/3/2024 10:30\n"
+            + "3,Gamma,East,100,200,2024-01-04T09:30:00,2024-01-04T10:30:00\n"
+        )
+        self.assertEqual(response.status_code, 302)
+        appointments = self.stored_appointments()
+        self.assertEqual(
+            [(a['agency_number'], a['start_time'], a['end_time'], a['start_hour']) for a in appointments],
+            [
+                ('1', '2024-01-02T09:00:00', '2024-01-02T10:00:00', 9.0),
+                ('2', '2024-01-03T09:30:00', '2024-01-03T10:30:00', 9.5),
+                ('3', '2024-01-04T09:30:00', '2024-01-04T10:30:00', 9.5),
+            ]
+        )
+
+    def test_times_with_different_utc_offsets(self):
+        # Either side of a DST change
+        response = self.upload(
+            CSV_HEADER
+            + "1,Acme,North,100,200,2024-03-09T09:00-05:00,2024-03-09T10:00-05:00\n"
+            + "2,Beta,South,100,200,2024-03-11T09:30-04:00,2024-03-11T10:30-04:00\n"
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [(a['start_time'], a['end_time'], a['start_hour']) for a in self.stored_appointments()],
+            [
+                ('2024-03-09T09:00:00-05:00', '2024-03-09T10:00:00-05:00', 9.0),
+                ('2024-03-11T09:30:00-04:00', '2024-03-11T10:30:00-04:00', 9.5),
+            ]
+        )
+
+    def test_times_with_and_without_utc_offset(self):
+        response = self.upload(
+            CSV_HEADER
+            + "1,Acme,North,100,200,2024-01-02 09:00,2024-01-02 10:00\n"
+            + "2,Beta,South,100,200,2024-01-03T09:30-05:00,2024-01-03T10:30-05:00\n"
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [(a['start_time'], a['end_time'], a['start_hour']) for a in self.stored_appointments()],
+            [
+                ('2024-01-02T09:00:00', '2024-01-02T10:00:00', 9.0),
+                ('2024-01-03T09:30:00-05:00', '2024-01-03T10:30:00-05:00', 9.5),
+            ]
+        )
+
+    def test_unparseable_times_are_skipped(self):
+        self.upload(
+            CSV_HEADER
+            + "1,Acme,North,100,200,2024-01-02 09:00,2024-01-02 10:00\n"
+            + "2,Beta,South,100,200,not a time,2024-01-03 10:30\n"
+        )
+        self.assertEqual([a['agency_number'] for a in self.stored_appointments()], ['1'])
+
+
+if __name__ == '__main__':
+    unittest.main()